@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Contention benchmark for read-modify-write workloads.
+
+Every transaction reads a hot resource and then writes it, requesting first
+a read lock (SLock or ULock, depending on the run) and then an XLock.
+Transactions are interleaved round robin, a transaction that waits is not
+scheduled until its lock is granted, and when every live transaction is
+waiting the youngest one is aborted (End) to break the deadlock. Aborted
+transactions are retried as new ones, one after each commit, until they
+commit too. Both runs do the same work, so waits and aborts are reported per
+committed transaction.
+
+A round is one pass over the live transactions. The rounds each transaction
+spends waiting measure how long its waits last: both strategies wait about
+once per transaction, but an S->X wait often only ends when the deadlock it
+is part of is broken, by an abort.
+
+Usage:
+    PYTHONPATH=./src python benchmarks/contention.py [transactions] [resources] [seed]
+"""
+import random
+import sys
+import time
+from collections import deque
+from itertools import count
+from lock_manager import LockManager, Events, States
+
+
+def run(read_event: Events, transactions: int, resources: int, seed: int) -> dict:
+    rnd = random.Random(seed)
+    lm = LockManager()
+    stats = {'waits': 0, 'aborted_waits': 0, 'wait_rounds': 0, 'rounds': 0, 'aborts': 0, 'committed': 0}
+
+    # pending steps per transaction: (event, resource, expected lock)
+    plans = {}
+    programs = {}
+    read_lock = States.slock if read_event is Events.SLOCK else States.ulock
+    ids = count(1)
+
+    def start(plan):
+        t = next(ids)
+        lm.process_request(Events.START, t)
+        plans[t] = plan
+        programs[t] = list(plan)
+
+    for _ in range(transactions):
+        r = f"R{rnd.randrange(resources)}"
+        start([(read_event, r, read_lock), (Events.XLOCK, r, States.xlock)])
+    waiting = {}
+    retries = deque()
+
+    while programs or retries:
+        if not programs:
+            start(retries.popleft())
+        progressed = False
+        stats['rounds'] += 1
+        stats['wait_rounds'] += len(waiting)
+        for t in list(programs):
+            if t in waiting:
+                resource, lock_type = waiting[t]
+                if lm.held_locks.get(t, {}).get(resource) is not lock_type:
+                    continue
+                del waiting[t]
+            if not programs[t]:
+                lm.process_request(Events.END, t)
+                del programs[t]
+                del plans[t]
+                stats['committed'] += 1
+                if retries:
+                    start(retries.popleft())
+                progressed = True
+                continue
+
+            event, resource, lock_type = programs[t].pop(0)
+            cmds = lm.process_request(event, t, resource)
+            if cmds and cmds[0].cmd in ('waiting', 'waiting_upgrade'):
+                stats['waits'] += 1
+                waiting[t] = (resource, lock_type)
+            progressed = True
+
+        if not progressed:
+            # every live transaction is waiting, abort the youngest one
+            victim = max(programs)
+            lm.process_request(Events.END, victim)
+            del programs[victim]
+            del waiting[victim]
+            retries.append(plans.pop(victim))
+            stats['aborted_waits'] += 1
+            stats['aborts'] += 1
+
+    return stats
+
+
+def main():
+    transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    resources = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 42
+
+    for name, event in (('S->X', Events.SLOCK), ('U->X', Events.ULOCK)):
+        start = time.perf_counter()
+        stats = run(event, transactions, resources, seed)
+        elapsed = time.perf_counter() - start
+        committed = stats['committed']
+        print(f"{name}: {committed} committed in {stats['rounds']} rounds, {stats['waits']} waits "
+              f"({stats['waits'] / committed:.2f}/txn, {stats['aborted_waits']} ended in an abort), "
+              f"{stats['wait_rounds'] / committed:.1f} rounds waited/txn, {stats['aborts']} aborts "
+              f"({stats['aborts'] / committed:.2f}/txn) in {elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,10 @@
 Reads from input_stream line by line, processes each line through the lock manager,
 and writes results to output_stream without buffering. Errors are written to error_stream.
 """
+import argparse
 import sys
 from typing import Iterable, TextIO
-from lock_manager import LockManager
+from lock_manager import LockManager, Output
 
 
 def is_interactive() -> bool:
@@ -16,10 +17,17 @@ def is_interactive() -> bool:
 
 def stream_processor(input_stream: TextIO,
                      output_stream: TextIO,
-                     error_stream: TextIO = sys.stderr) -> None:
-    """Process lines from input_stream and write to output_stream immediately."""
+                     error_stream: TextIO = sys.stderr,
+                     output: str = 'text') -> None:
+    """Process lines from input_stream and write to output_stream immediately.
 
-    lm = LockManager()
+    With a structured output (jsonl, tsv, binary) errors are written as records
+    to output_stream, binary records go to the underlying buffer when there is one.
+    """
+
+    lm = LockManager(output=output)
+    if lm.output is Output.BINARY:
+        output_stream = getattr(output_stream, 'buffer', output_stream)
 
     if is_interactive():
         print("Simple lock manager: Starting processing, please execute commands:", file=sys.stderr)  # Status to stderr
@@ -30,7 +38,9 @@ def stream_processor(input_stream: TextIO,
             result = lm.process_request_str(line.rstrip('\n'))
 
             # Handle both single items and iterables
-            if isinstance(result, str) or not isinstance(result, Iterable):
+            if isinstance(result, bytes):
+                output_stream.write(result)
+            elif isinstance(result, str) or not isinstance(result, Iterable):
                 output_stream.write(f"{result}\n")
             else:
                 for item in result:
@@ -45,8 +55,13 @@ def stream_processor(input_stream: TextIO,
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Simple lock manager")
+    parser.add_argument('--output', choices=[o.value for o in Output], default='text',
+                        help="output format, text (default), JSON Lines, tab-separated or binary records")
+    args = parser.parse_args()
+
     try:
-        stream_processor(sys.stdin, sys.stdout)
+        stream_processor(sys.stdin, sys.stdout, output=args.output)
     except KeyboardInterrupt:
         sys.stderr.write("\nProcessing interrupted by user\n")
         sys.exit(1)
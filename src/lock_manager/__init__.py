@@ -1,5 +1,6 @@
-from .simple import LockManager, Events, States
+from .simple import LockManager, Command, Events, Queries, States
+from .output import Output
 VERSION = '0.0.1'
 AUTHOR = 'Sebastian Tabares'
 
-__all__ = ['LockManager', 'Events', 'States']
+__all__ = ['LockManager', 'Command', 'Events', 'Output', 'Queries', 'States']
@@ -0,0 +1,212 @@
+from collections.abc import MutableMapping
+from itertools import islice
+
+_MISSING = object()
+
+# Layers a lookup may go through before the chain is flattened
+MAX_DEPTH = 32
+# Base entries copied by each detach() step
+DETACH_STEP = 32
+
+
+class CowDict(MutableMapping):
+    """
+    Copy-on-write dict layered over a frozen base.
+
+    Writes and deletes only touch the local layer, so any number of CowDicts
+    can share the same base. With copy_values, values are dicts shared with
+    the base: reads never copy them, values to be mutated in place must be
+    taken through writable(), which copies them to the local layer first.
+
+    Iteration follows the order of a plain dict with the same history: keys
+    overwritten in the local layer keep their base position, keys deleted and
+    set again move to the end. removed keeps the deleted keys even once they
+    are set again, to tell them apart.
+
+    detach() turns it back into a plain dict a few entries at a time, for the
+    side of a fork that keeps serving requests.
+    """
+
+    __slots__ = ('local', 'base', 'removed', 'size', 'depth', 'copy_values', 'pending', 'copied')
+
+    def __init__(self, base=None, copy_values: bool = False):
+        base = {} if base is None else base
+        self.local = {}
+        self.base = base
+        self.removed = set()
+        self.size = len(base)
+        self.depth = base.depth + 1 if type(base) is CowDict else 1
+        self.copy_values = copy_values
+        self.pending = None
+        self.copied = None
+
+    def lookup(self, key):
+        """Read only lookup through the layers, _MISSING if not found"""
+
+        layer = self
+        while type(layer) is CowDict:
+            value = layer.local.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            if key in layer.removed:
+                return _MISSING
+            layer = layer.base
+        return layer.get(key, _MISSING)
+
+    def __getitem__(self, key):
+        value = self.local.get(key, _MISSING)
+        if value is _MISSING:
+            value = self.lookup(key)
+            if value is _MISSING:
+                raise KeyError(key)
+        return value
+
+    def writable(self, key, default=_MISSING):
+        """Value for key, ready to be mutated in place.
+
+        With copy_values, a value read from the base is copied to the local
+        layer first. default is inserted when key is missing, like setdefault.
+        """
+
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = self.lookup(key)
+        if value is _MISSING:
+            if default is _MISSING:
+                raise KeyError(key)
+            self[key] = default
+            return default
+        if self.copy_values:
+            value = self.local[key] = dict(value)
+        return value
+
+    def get(self, key, default=None):
+        value = self.lookup(key)
+        return default if value is _MISSING else value
+
+    def __contains__(self, key):
+        return self.lookup(key) is not _MISSING
+
+    def __setitem__(self, key, value):
+        if key not in self.local and (key in self.removed or key not in self):
+            self.size += 1
+        self.local[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.local.pop(key, None)
+        self.removed.add(key)
+        self.size -= 1
+
+    def __iter__(self):
+        return iter(self.flatten())
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f"CowDict({dict(self.flatten())!r})"
+
+    def flatten(self) -> dict:
+        """Plain dict with every entry, values are not copied.
+
+        Layers are merged bottom-up in one pass, O(n) plus the size of the layers.
+        """
+
+        layers = []
+        layer = self
+        while type(layer) is CowDict:
+            layers.append(layer)
+            layer = layer.base
+        out = dict(layer)
+        for layer in reversed(layers):
+            for key in layer.removed:
+                out.pop(key, None)
+            out.update(layer.local)
+        return out
+
+    def iter_items(self):
+        """Entries in iteration order, merged lazily through the layers.
+
+        Nothing is done up front, unlike flatten(), each entry costs O(depth).
+        """
+
+        layers = []
+        layer = self
+        while type(layer) is CowDict:
+            layers.append(layer)
+            layer = layer.base
+        layers.reverse()
+        sources = [layer] + [cow.local for cow in layers]
+        for i, source in enumerate(sources):
+            above = layers[i:]
+            for key in source:
+                # a key comes from the lowest layer that holds it, or the last
+                # one it was set again in after a delete
+                if any(key in cow.removed for cow in above):
+                    continue
+                if i and key not in layers[i - 1].removed and key in layers[i - 1].base:
+                    continue
+                yield key, self.lookup(key)
+
+    def detach(self):
+        """Copy the next DETACH_STEP base entries aside.
+
+        The layers of the base are merged as the entries are copied, so no
+        step costs more than DETACH_STEP entries, whatever the size of the base.
+
+        Returns a plain dict with every entry, that no longer shares anything
+        with the base, once they are all copied, None until then.
+        """
+
+        if self.pending is None:
+            base = self.base
+            self.pending = base.iter_items() if type(base) is CowDict else iter(base.items())
+            self.copied = {}
+        copied = self.copied
+        size = len(copied)
+        if self.copy_values:
+            copied.update((key, dict(value)) for key, value in islice(self.pending, DETACH_STEP))
+        else:
+            copied.update(islice(self.pending, DETACH_STEP))
+        if len(copied) - size == DETACH_STEP:
+            return None
+
+        for key in self.removed:
+            copied.pop(key, None)
+        copied.update(self.local)
+        return copied
+
+
+def cow_fork(d, copy_values: bool = False):
+    """Two independent copy-on-write views of d, d must not be mutated afterwards.
+
+    O(1), unless the chain of layers is already MAX_DEPTH long, then it is
+    flattened first, in one O(n) pass.
+    """
+
+    if type(d) is CowDict and d.depth >= MAX_DEPTH:
+        d = d.flatten()
+    return CowDict(d, copy_values), CowDict(d, copy_values)
+
+
+def writable(d, key, default=_MISSING):
+    """d[key] ready to be mutated in place, for both CowDicts and plain dicts"""
+
+    if type(d) is CowDict:
+        return d.writable(key, default)
+    if default is _MISSING:
+        return d[key]
+    return d.setdefault(key, default)
+
+
+def detach_step(d):
+    """d after one detach() step, the plain dict it becomes once detached"""
+
+    if type(d) is CowDict:
+        plain = d.detach()
+        if plain is not None:
+            return plain
+    return d
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""Differential fuzzer between the reference and the optimized lock engines.
+
+Generates random (optionally zipf-skewed) schedules of Start, End, SLock,
+ULock, XLock and Unlock requests, runs them through ReferenceLockManager and
+LockManager, and compares the Command streams step by step and the lock
+tables every check_every steps. A failing schedule is shrunk to a minimal
+reproducer, printed as CLI request lines.
+
+Usage:
+    PYTHONPATH=./src python -m lock_manager.fuzz [--ops N] [--seed S] [--skew Z] ...
+"""
+import argparse
+import random
+import sys
+import time
+from dataclasses import dataclass
+from .reference import ReferenceLockManager
+from .simple import Events, LockManager
+
+EVENTS = (Events.START, Events.END, Events.SLOCK, Events.ULOCK, Events.XLOCK, Events.UNLOCK)
+
+
+@dataclass
+class FuzzConfig:
+    ops: int = 100_000
+    seed: int = 0
+    transactions: int = 8
+    resources: int = 8
+    # zipf exponent of the transactions and resources popularity, 0 is uniform
+    skew: float = 0.0
+    # relative weight of each one of EVENTS
+    weights: tuple = (2, 1, 3, 1, 2, 2)
+    # each schedule starts with fresh engines, so reproducers stay short
+    schedule_length: int = 10_000
+    check_every: int = 100
+    # replace the optimized engine with a fork of it every fork_every steps, 0 never
+    fork_every: int = 0
+
+
+@dataclass
+class Divergence:
+    step: int
+    reason: str
+    expected: object
+    got: object
+
+
+@dataclass
+class FuzzReport:
+    ops: int = 0
+    schedules: int = 0
+    elapsed: float = 0.0
+    divergence: Divergence = None
+    # minimal failing schedule
+    reproducer: list = None
+
+
+def cum_weights(n: int, skew: float) -> list:
+    total = 0.0
+    out = []
+    for i in range(n):
+        total += 1 / (i + 1) ** skew
+        out.append(total)
+    return out
+
+
+def make_schedule(rnd: random.Random, length: int, config: FuzzConfig) -> list:
+    """List of (event, transaction, resource) requests"""
+
+    events = rnd.choices(EVENTS, weights=config.weights, k=length)
+    transactions = rnd.choices(range(1, config.transactions + 1),
+                               cum_weights=cum_weights(config.transactions, config.skew), k=length)
+    resources = rnd.choices([f"R{i}" for i in range(config.resources)],
+                            cum_weights=cum_weights(config.resources, config.skew), k=length)
+    return [(e, t, None if e is Events.START or e is Events.END else r)
+            for e, t, r in zip(events, transactions, resources)]
+
+
+def lock_tables(lm) -> tuple:
+    """Lock tables without the empty entries left behind, in insertion order"""
+    return (
+        list(lm.transactions),
+        {t: dict(locks) for t, locks in lm.held_locks.items() if locks},
+        {r: list(held.items()) for r, held in lm.held_resources.items() if held},
+        {r: list(fifo.items()) for r, fifo in lm.resource_fifo.items() if fifo},
+    )
+
+
+def run_schedule(schedule: list, check_every: int = 1, fork_every: int = 0,
+                 engine=LockManager, reference=ReferenceLockManager) -> Divergence:
+    """Run the schedule through both engines, None if they agree"""
+
+    ref = reference()
+    lm = engine()
+    last = len(schedule) - 1
+    for i, request in enumerate(schedule):
+        if fork_every and i % fork_every == fork_every - 1:
+            lm = lm.fork()
+
+        try:
+            expected = ref.process_request(*request)
+        except Exception as e:
+            expected = repr(e)
+        try:
+            got = lm.process_request(*request)
+        except Exception as e:
+            got = repr(e)
+        if got != expected:
+            return Divergence(i, 'commands', expected, got)
+
+        if (check_every and (i + 1) % check_every == 0) or i == last:
+            expected, got = lock_tables(ref), lock_tables(lm)
+            if got != expected:
+                return Divergence(i, 'lock tables', expected, got)
+    return None
+
+
+def shrink(schedule: list, fails) -> list:
+    """Delta debugging, removes chunks of requests while the schedule still fails"""
+
+    n = 2
+    while len(schedule) >= 2:
+        chunk = -(-len(schedule) // n)
+        for start in range(0, len(schedule), chunk):
+            candidate = schedule[:start] + schedule[start + chunk:]
+            if fails(candidate):
+                schedule = candidate
+                n = max(n - 1, 2)
+                break
+        else:
+            if chunk == 1:
+                break
+            n = min(n * 2, len(schedule))
+    return schedule
+
+
+def fuzz(config: FuzzConfig, engine=LockManager, reference=ReferenceLockManager) -> FuzzReport:
+    rnd = random.Random(config.seed)
+    report = FuzzReport()
+    start = time.perf_counter()
+
+    while report.ops < config.ops:
+        schedule = make_schedule(rnd, min(config.schedule_length, config.ops - report.ops), config)
+        divergence = run_schedule(schedule, config.check_every, config.fork_every, engine, reference)
+        report.schedules += 1
+
+        if divergence:
+            report.ops += divergence.step + 1
+
+            def fails(candidate):
+                return run_schedule(candidate, 1, config.fork_every, engine, reference) is not None
+
+            report.reproducer = shrink(schedule[:divergence.step + 1], fails)
+            report.divergence = run_schedule(report.reproducer, 1, config.fork_every, engine, reference)
+            break
+        report.ops += len(schedule)
+
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def request_lines(schedule: list) -> list:
+    return [f"{e.value} {t} {r}" if r else f"{e.value} {t}" for e, t, r in schedule]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Differential fuzzer between the reference and optimized lock engines")
+    parser.add_argument('--ops', type=int, default=FuzzConfig.ops)
+    parser.add_argument('--seed', type=int, default=FuzzConfig.seed)
+    parser.add_argument('--transactions', type=int, default=FuzzConfig.transactions)
+    parser.add_argument('--resources', type=int, default=FuzzConfig.resources)
+    parser.add_argument('--skew', type=float, default=FuzzConfig.skew, help="zipf exponent, 0 is uniform")
+    parser.add_argument('--length', type=int, default=FuzzConfig.schedule_length, help="requests per schedule")
+    parser.add_argument('--check-every', type=int, default=FuzzConfig.check_every)
+    parser.add_argument('--fork-every', type=int, default=FuzzConfig.fork_every)
+    args = parser.parse_args()
+
+    config = FuzzConfig(ops=args.ops, seed=args.seed, transactions=args.transactions,
+                        resources=args.resources, skew=args.skew, schedule_length=args.length,
+                        check_every=args.check_every, fork_every=args.fork_every)
+    report = fuzz(config)
+    print(f"{report.ops} ops in {report.schedules} schedules, {report.elapsed:.2f}s "
+          f"({report.ops / report.elapsed:.0f} ops/s)", file=sys.stderr)
+
+    if report.divergence:
+        d = report.divergence
+        print(f"Divergence in {d.reason} at step {d.step}:\n  reference: {d.expected}\n  optimized: {d.got}",
+              file=sys.stderr)
+        print("\n".join(request_lines(report.reproducer)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Machine-readable out adapters, made straight from Command fields.
+
+Text output lives in LockManager.commands_mapping, these formats skip it:
+nothing is formatted until a caller asks for it, and errors become records
+with error set instead of raised exceptions.
+"""
+import json
+import re
+import struct
+from enum import Enum
+
+
+class Output(Enum):
+    TEXT = 'text'
+    JSONL = 'jsonl'
+    TSV = 'tsv'
+    BINARY = 'binary'
+
+
+# Commands reported as errors (exceptions in text output)
+ERRORS = frozenset({
+    'cmd_not_valid', 'not_started', 'already_started', 'not_found',
+    'already_held', 'not_locked', 'not_locked_by', 'read_only',
+})
+
+# Binary command codes, only append new commands so codes stay stable
+COMMANDS = (
+    'cmd_not_valid', 'transaction_started', 'transaction_ended', 'not_started',
+    'already_started', 'not_found', 'granted', 'granted_to', 'upgrade', 'upgrade_to',
+    'waiting', 'waiting_upgrade', 'resource_granted_to', 'resource_upgrade_to',
+    'unlocked', 'already_held', 'release_unlocked', 'not_locked', 'not_locked_by',
+    'holder', 'not_held', 'waits_for', 'not_waiting', 'no_waits', 'no_locks',
+    'read_only',
+)
+COMMAND_CODES = {cmd: code for code, cmd in enumerate(COMMANDS)}
+
+LOCK_CODES = {None: 0, 'slocked': 1, 'ulocked': 2, 'xlocked': 3}
+LOCK_NAMES = {code: name for name, code in LOCK_CODES.items()}
+
+# cmd code, lock code, has transaction, transaction, resource length, extra length
+HEADER = struct.Struct('<BB?qII')
+# largest transaction id a binary record can hold
+MAX_TRANSACTION = 2 ** 63 - 1
+# largest resource or extra a binary record can hold, in bytes
+MAX_FIELD = 2 ** 32 - 1
+
+
+def _value(value):
+    return value.value if isinstance(value, Enum) else value
+
+
+def to_record(cmd) -> dict:
+    return {
+        'cmd': cmd.cmd,
+        'transaction': cmd.transaction,
+        'resource': cmd.resource,
+        'lock_type': _value(cmd.lock_type),
+        'extra': {k: _value(v) for k, v in cmd.extra.items()} if cmd.extra else None,
+        'error': cmd.cmd in ERRORS,
+    }
+
+
+def to_jsonl(cmds: list) -> str:
+    return "\n".join(json.dumps(to_record(cmd), separators=(',', ':')) for cmd in cmds)
+
+
+# character after a backslash in a TSV field, to the escaped one
+TSV_UNESCAPES = {'\\': '\\', 't': '\t', 'n': '\n', 'r': '\r'}
+
+
+def _escape(field: str) -> str:
+    return field.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _unescape(field: str) -> str:
+    return re.sub(r'\\(.)', lambda m: TSV_UNESCAPES[m.group(1)], field)
+
+
+def to_tsv(cmds: list) -> str:
+    """cmd, transaction, resource, lock_type, error (0/1) and extra as a JSON object
+
+    Backslash, tab, newline and carriage return are escaped C style in the
+    first five fields. extra is compact JSON, which never holds those
+    characters raw, so it is written as is. A record is always one line of
+    six fields.
+    """
+
+    lines = []
+    for cmd in cmds:
+        extra = json.dumps({k: _value(v) for k, v in cmd.extra.items()},
+                           separators=(',', ':')) if cmd.extra else ''
+        lines.append("\t".join([_escape(field) for field in (
+            cmd.cmd,
+            '' if cmd.transaction is None else str(cmd.transaction),
+            cmd.resource or '',
+            _value(cmd.lock_type) or '',
+            '1' if cmd.cmd in ERRORS else '0',
+        )] + [extra]))
+    return "\n".join(lines)
+
+
+def read_tsv(data: str) -> list:
+    """Decode to_tsv records back into to_record dicts"""
+
+    records = []
+    for line in data.split("\n") if data else []:
+        *fields, extra = line.split("\t")
+        cmd, transaction, resource, lock_type, error = [_unescape(field) for field in fields]
+        records.append({
+            'cmd': cmd,
+            'transaction': int(transaction) if transaction else None,
+            'resource': resource or None,
+            'lock_type': lock_type or None,
+            'extra': json.loads(extra) if extra else None,
+            'error': error == '1',
+        })
+    return records
+
+
+def to_binary(cmds: list) -> bytes:
+    """Length-prefixed records: HEADER, then resource (utf-8) and extra (JSON) bytes
+
+    A command that does not fit in a record (transaction beyond int64, resource
+    or extra over MAX_FIELD bytes) is written as a cmd_not_valid record instead,
+    with the original cmd in extra.
+    """
+
+    out = bytearray()
+    for cmd in cmds:
+        code, lock = COMMAND_CODES[cmd.cmd], LOCK_CODES[_value(cmd.lock_type)]
+        transaction = cmd.transaction
+        resource = cmd.resource.encode() if cmd.resource else b''
+        extra = json.dumps({k: _value(v) for k, v in cmd.extra.items()},
+                           separators=(',', ':')).encode() if cmd.extra else b''
+        if (transaction is not None and not -MAX_TRANSACTION - 1 <= transaction <= MAX_TRANSACTION) \
+                or len(resource) > MAX_FIELD or len(extra) > MAX_FIELD:
+            code, lock, transaction, resource = COMMAND_CODES['cmd_not_valid'], 0, None, b''
+            extra = json.dumps({'cmd': cmd.cmd}, separators=(',', ':')).encode()
+        out += HEADER.pack(code, lock, transaction is not None, transaction or 0,
+                           len(resource), len(extra))
+        out += resource
+        out += extra
+    return bytes(out)
+
+
+def read_binary(data: bytes) -> list:
+    """Decode to_binary records back into to_record dicts"""
+
+    records = []
+    offset = 0
+    while offset < len(data):
+        code, lock, has_transaction, transaction, resource_len, extra_len = HEADER.unpack_from(data, offset)
+        offset += HEADER.size
+        resource = data[offset:offset + resource_len].decode() if resource_len else None
+        offset += resource_len
+        extra = json.loads(data[offset:offset + extra_len]) if extra_len else None
+        offset += extra_len
+        records.append({
+            'cmd': COMMANDS[code],
+            'transaction': transaction if has_transaction else None,
+            'resource': resource,
+            'lock_type': LOCK_NAMES[lock],
+            'extra': extra,
+            'error': COMMANDS[code] in ERRORS,
+        })
+    return records
+
+
+FORMATTERS = {
+    Output.JSONL: to_jsonl,
+    Output.TSV: to_tsv,
+    Output.BINARY: to_binary,
+}
@@ -0,0 +1,87 @@
+from .cow import CowDict, cow_fork, detach_step, writable
+
+
+class LockIndex:
+    """
+    Secondary indexes over the live lock state of a LockManager.
+
+    Kept up to date on every grant, release and wait, so operational queries
+    never walk held_locks, held_resources or resource_fifo:
+
+        waits_by_trx    transaction -> {resource: lock_type} it is waiting for
+        waits           (transaction, resource) -> (lock_type, since), oldest first
+        holders_by_mode lock_type -> {(transaction, resource)}
+
+    Resources may be single keys or key ranges.
+    """
+
+    def __init__(self, modes):
+        self.waits_by_trx = {}
+        self.waits = {}
+        # dicts used as sets, so they can be forked copy-on-write
+        self.holders_by_mode = {mode: {} for mode in modes}
+        self.held = {}
+
+    def fork(self) -> 'LockIndex':
+        """O(1) copy-on-write copy, see LockManager.fork"""
+
+        fork = LockIndex(())
+        self.waits_by_trx, fork.waits_by_trx = cow_fork(self.waits_by_trx, True)
+        self.waits, fork.waits = cow_fork(self.waits)
+        self.held, fork.held = cow_fork(self.held)
+        for mode, holders in self.holders_by_mode.items():
+            self.holders_by_mode[mode], fork.holders_by_mode[mode] = cow_fork(holders)
+        return fork
+
+    def detach(self) -> bool:
+        """One detach step of the dicts shared with a fork, True until they are all plain again"""
+
+        self.waits_by_trx = detach_step(self.waits_by_trx)
+        self.waits = detach_step(self.waits)
+        self.held = detach_step(self.held)
+        for mode, holders in self.holders_by_mode.items():
+            self.holders_by_mode[mode] = detach_step(holders)
+        return any(type(d) is CowDict for d in (
+            self.waits_by_trx, self.waits, self.held, *self.holders_by_mode.values()))
+
+    def hold(self, transaction: int, resource: str, lock_type):
+        old = self.held.get((transaction, resource))
+        if old is not None:
+            self.holders_by_mode[old].pop((transaction, resource), None)
+        self.held[(transaction, resource)] = lock_type
+        self.holders_by_mode[lock_type][(transaction, resource)] = None
+
+    def release(self, transaction: int, resource: str):
+        old = self.held.pop((transaction, resource), None)
+        if old is not None:
+            self.holders_by_mode[old].pop((transaction, resource), None)
+
+    def wait(self, transaction: int, resource: str, lock_type, since: float):
+        # re-inserted, so waits keeps the age order
+        self.waits.pop((transaction, resource), None)
+        self.waits[(transaction, resource)] = (lock_type, since)
+        writable(self.waits_by_trx, transaction, {})[resource] = lock_type
+
+    def unwait(self, transaction: int, resource: str):
+        if self.waits.pop((transaction, resource), None) is None:
+            return
+        waiting = writable(self.waits_by_trx, transaction)
+        del waiting[resource]
+        if not waiting:
+            del self.waits_by_trx[transaction]
+
+    def waiting_for(self, transaction: int) -> dict:
+        return dict(self.waits_by_trx.get(transaction, {}))
+
+    def waits_since(self, cutoff: float) -> list:
+        """(transaction, resource, lock_type, since) of the waits started at or before cutoff"""
+
+        out = []
+        for (transaction, resource), (lock_type, since) in self.waits.items():
+            if since > cutoff:
+                break
+            out.append((transaction, resource, lock_type, since))
+        return out
+
+    def holding(self, lock_type) -> list:
+        return sorted(self.holders_by_mode[lock_type], key=str)
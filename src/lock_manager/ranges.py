@@ -0,0 +1,168 @@
+import random
+import re
+
+RANGE_PATTERN = re.compile(r"^\[(\w+),(\w+)([)\]])$")
+
+
+def parse_range(resource: str):
+    """Parse a key range resource into half-open (lo, hi) bounds
+
+    Supported syntax:
+        [A,M)   keys from A (included) to M (excluded)
+        [A,M]   keys from A to M, both included
+        A*      keys starting with prefix A
+
+    Returns None when the resource is a single key, and an empty range
+    for an empty prefix
+    """
+
+    if resource.endswith('*'):
+        prefix = resource[:-1]
+        if not prefix:
+            return '', ''
+        # the smallest string greater than every key starting with prefix
+        return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    match = RANGE_PATTERN.match(resource)
+    if match:
+        lo, hi, bracket = match.groups()
+        # the successor of hi, so the closed range can be stored half-open
+        return lo, hi + '\0' if bracket == ']' else hi
+
+    return None
+
+
+class _Node:
+    __slots__ = ('key', 'value', 'priority', 'max_hi', 'left', 'right')
+
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+        self.priority = random.random()
+        self.max_hi = key[1]
+        self.left = None
+        self.right = None
+
+    def copy(self):
+        node = _Node.__new__(_Node)
+        node.key = self.key
+        node.value = self.value
+        node.priority = self.priority
+        node.max_hi = self.max_hi
+        node.left = self.left
+        node.right = self.right
+        return node
+
+    def update(self):
+        self.max_hi = self.key[1]
+        if self.left and self.left.max_hi > self.max_hi:
+            self.max_hi = self.left.max_hi
+        if self.right and self.right.max_hi > self.max_hi:
+            self.max_hi = self.right.max_hi
+
+
+class IntervalTree:
+    """
+    Index of half-open [lo, hi) intervals, each one tagged with an owner.
+
+    Implemented as a treap ordered by (lo, hi, owner) where every node keeps
+    the max hi of its subtree, so insert and remove run in O(log n) and
+    overlap queries in O(log n + k), k being the number of overlaps.
+
+    The treap is persistent, nodes are copied along the modified path instead
+    of being changed in place, so fork() shares every node and is O(1).
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def fork(self) -> 'IntervalTree':
+        tree = IntervalTree()
+        tree.root = self.root
+        tree.size = self.size
+        return tree
+
+    def get(self, lo, hi, owner, default=None):
+        key = (lo, hi, owner)
+        node = self.root
+        while node is not None:
+            if key == node.key:
+                return node.value
+            node = node.left if key < node.key else node.right
+        return default
+
+    def insert(self, lo, hi, owner, value):
+        """Insert the interval, or replace its value if already present"""
+
+        key = (lo, hi, owner)
+        left, rest = self._split(self.root, key, False)
+        node, right = self._split(rest, key, True)
+        if node is None:
+            self.size += 1
+        node = _Node(key, value)
+        self.root = self._merge(self._merge(left, node), right)
+
+    def remove(self, lo, hi, owner):
+        key = (lo, hi, owner)
+        left, rest = self._split(self.root, key, False)
+        node, right = self._split(rest, key, True)
+        if node is not None:
+            self.size -= 1
+        self.root = self._merge(left, right)
+
+    def overlapping(self, lo, hi):
+        """Yield (lo, hi, owner, value) for every interval overlapping [lo, hi), ordered"""
+
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            # skip subtrees where no interval ends after lo
+            while node is not None and node.max_hi > lo:
+                stack.append(node)
+                node = node.left
+            if not stack:
+                return
+            node = stack.pop()
+            # in order traversal, every following interval starts after hi
+            if node.key[0] >= hi:
+                return
+            if lo < node.key[1]:
+                yield node.key + (node.value,)
+            node = node.right
+
+    def _split(self, node, key, inclusive):
+        """Split in (< key, >= key), or (<= key, > key) when inclusive"""
+
+        if node is None:
+            return None, None
+        node = node.copy()
+        if node.key < key or (inclusive and node.key == key):
+            left, right = self._split(node.right, key, inclusive)
+            node.right = left
+            node.update()
+            return node, right
+        else:
+            left, right = self._split(node.left, key, inclusive)
+            node.left = right
+            node.update()
+            return left, node
+
+    def _merge(self, left, right):
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.priority > right.priority:
+            left = left.copy()
+            left.right = self._merge(left.right, right)
+            left.update()
+            return left
+        else:
+            right = right.copy()
+            right.left = self._merge(left, right.left)
+            right.update()
+            return right
@@ -0,0 +1,367 @@
+"""Reference lock engine, frozen copy of the LockManager point lock FSMs.
+
+Do not optimize or change this module: it is the oracle the differential
+fuzzer (lock_manager.fuzz) compares LockManager against, so any speed work
+on LockManager keeps the semantics of fsm-diagram.png. Only single key
+Start, End, SLock, ULock, XLock and Unlock requests are modeled, with
+plain dicts and no secondary indexes.
+"""
+from .simple import Command, Events, States
+
+COMPATIBLE = {
+    (States.slock, States.slock),
+    (States.slock, States.ulock),
+    (States.ulock, States.slock),
+}
+
+LOCK_TYPES = {Events.SLOCK: States.slock,
+              Events.ULOCK: States.ulock,
+              Events.XLOCK: States.xlock}
+
+
+class ReferenceLockManager:
+    """Same process_request interface and lock tables as LockManager"""
+
+    def __init__(self):
+        self.held_locks = {}
+        self.transactions = {}
+        self.resource_fifo = {}
+        self.held_resources = {}
+
+    def process_request(self, request: str, transaction: int, resource: str = None) -> list[Command]:
+        """Business logic, based in transaction and resource FSMs"""
+
+        cmds = []
+        try:
+            req = Events(request)
+        except ValueError:
+            return [Command("cmd_not_valid", transaction, resource)]
+
+        # Transaction FSM
+        if not resource:
+            cmds.extend(self.transactionFSM(req, transaction))
+        # Resource FSM
+        else:
+            cmds.extend(self.resourceFSM(req, transaction, resource))
+
+        return cmds
+
+    def transactionFSM(self, req, transaction):
+        """see fsm-diagram.png/transaction FSM for design reference"""
+
+        cmds = []
+
+        # not_init state
+        if transaction not in self.transactions:
+            if req is Events.START:
+                self.transactions[transaction] = None
+                cmds.append(Command('transaction_started', transaction))
+            elif req is Events.END:
+                return [Command('not_started', transaction)]
+        # init state
+        elif transaction in self.transactions:
+            if req is Events.END:
+                cmds.append(Command('transaction_ended', transaction))
+
+                # Clean waiting locks first, so they are not granted while releasing
+                for xt in self.resource_fifo.values():
+                    if transaction in xt:
+                        del xt[transaction]
+
+                # Unlock all resources that this transaction holds
+                locked_resources = list(
+                    self.held_locks.get(transaction, {}).keys())
+                for r in locked_resources:
+                    _cmds = self.process_request(
+                        Events.UNLOCK, transaction, r)
+                    cmds.extend(self.release_cmds(_cmds))
+
+                # Finally remove tracking transaction
+                del self.transactions[transaction]
+                if self.held_locks.get(transaction):
+                    del self.held_locks[transaction]
+            else:
+                return [Command('already_started', transaction)]
+
+        return cmds
+
+    def release_cmds(self, cmds: list[Command]) -> list[Command]:
+        """Unlock commands, as reported when a transaction ends"""
+
+        out = []
+        if 0 < len(cmds):
+            cmd = cmds[0]
+            out.append(
+                Command(f"release_{cmd.cmd}", cmd.transaction, cmd.resource, cmd.lock_type))
+        for cmd in cmds[1:]:
+            out.append(
+                Command(f"resource_{cmd.cmd}", cmd.transaction, cmd.resource, cmd.lock_type))
+        return out
+
+    def resourceFSM(self, req, transaction, resource):
+        """see fsm-diagram.png/resource FSM for design reference"""
+
+        cmds = []
+        mode = self.resource_mode(resource)
+
+        if transaction not in self.transactions:
+            return [Command("not_found", transaction, resource)]
+
+        # unlocked state
+        elif mode is None:
+            if req is Events.SLOCK:
+                cmds.extend(
+                    self.lock_resource(transaction, resource, States.slock))
+            elif req is Events.ULOCK:
+                cmds.extend(
+                    self.lock_resource(transaction, resource, States.ulock))
+            elif req is Events.XLOCK:
+                cmds.extend(
+                    self.lock_resource(transaction, resource, States.xlock))
+            elif req is Events.UNLOCK:
+                cmds.append(
+                    Command('not_locked', transaction, resource))
+
+        # slocked superstate
+        elif mode is States.slock:
+
+            # other cases of slocked superstate
+            if req is Events.SLOCK:
+                if self.same_trx(transaction, resource):
+                    cmds.append(
+                        Command('already_held', transaction, resource, States.slock))
+            elif req is Events.ULOCK:
+                # no update lock is held yet, so it is granted right away
+                if self.same_trx(transaction, resource):
+                    cmds.extend(
+                        self.upgrade(transaction, resource, States.ulock))
+                else:
+                    cmds.extend(
+                        self.lock_resource(transaction, resource, States.ulock))
+            elif req is Events.XLOCK:
+                if not self.same_trx(transaction, resource):
+                    cmds.extend(
+                        self.wait_for_lock(transaction, resource, States.xlock))
+            elif req is Events.UNLOCK:
+                if not self.same_trx(transaction, resource):
+                    cmds.append(
+                        Command('not_locked_by', transaction, resource))
+
+            # simple nested state
+            if len(self.resource_state(resource)) == 1:
+                if req is Events.SLOCK:
+                    if not self.same_trx(transaction, resource):
+                        cmds.extend(
+                            self.lock_resource(transaction, resource, States.slock))
+                elif req is Events.XLOCK:
+                    if self.same_trx(transaction, resource):
+                        cmds.extend(
+                            self.upgrade(transaction, resource, States.xlock))
+                elif req is Events.UNLOCK:
+                    if self.same_trx(transaction, resource):
+                        cmds.extend(
+                            self.unlock(transaction, resource, States.slock))
+                        cmds.extend(
+                            self.grant_next_locks(resource))
+
+            # multiple nested state
+            else:
+                if req is Events.SLOCK:
+                    if not self.same_trx(transaction, resource):
+                        cmds.extend(
+                            self.lock_resource(transaction, resource, States.slock))
+                elif req is Events.XLOCK:
+                    if self.same_trx(transaction, resource):
+                        cmds.extend(
+                            self.wait_for_lock_upgrade(transaction, resource, States.xlock))
+                elif req is Events.UNLOCK:
+                    if self.same_trx(transaction, resource):
+                        cmds.extend(
+                            self.unlock(transaction, resource, States.slock))
+                        cmds.extend(
+                            self.grant_next_locks(resource))
+
+        # ulocked superstate, a single U holder along with zero or more S holders
+        elif mode is States.ulock:
+            held = self.same_trx(transaction, resource)
+            converting = self.pending_conversion(resource)
+            if req is Events.SLOCK:
+                if held:
+                    cmds.append(
+                        Command('already_held', transaction, resource, States.slock))
+                elif converting:
+                    # new readers queue behind the conversion, so they cannot starve it
+                    cmds.extend(
+                        self.wait_for_lock(transaction, resource, States.slock, converting))
+                else:
+                    cmds.extend(
+                        self.lock_resource(transaction, resource, States.slock))
+            elif req is Events.ULOCK:
+                if held is States.ulock:
+                    cmds.append(
+                        Command('already_held', transaction, resource, States.ulock))
+                elif held:
+                    cmds.extend(
+                        self.wait_for_lock_upgrade(transaction, resource, States.ulock))
+                else:
+                    cmds.extend(
+                        self.wait_for_lock(transaction, resource, States.ulock))
+            elif req is Events.XLOCK:
+                # U holder converts to X as soon as the other readers drain
+                if held is States.ulock and len(self.resource_state(resource)) == 1:
+                    cmds.extend(
+                        self.upgrade(transaction, resource, States.xlock))
+                elif held:
+                    cmds.extend(
+                        self.wait_for_lock_upgrade(transaction, resource, States.xlock))
+                else:
+                    cmds.extend(
+                        self.wait_for_lock(transaction, resource, States.xlock))
+            elif req is Events.UNLOCK:
+                if held:
+                    cmds.extend(
+                        self.unlock(transaction, resource, held))
+                    cmds.extend(
+                        self.grant_next_locks(resource))
+                else:
+                    cmds.append(
+                        Command('not_locked_by', transaction, resource))
+
+        # xlocked state
+        elif mode is States.xlock:
+            if req in LOCK_TYPES:
+                lock_type = LOCK_TYPES[req]
+                if self.same_trx(transaction, resource):
+                    cmds.append(
+                        Command('already_held', transaction, resource, lock_type))
+                else:
+                    cmds.extend(
+                        self.wait_for_lock(transaction, resource, lock_type))
+            if req is Events.UNLOCK:
+                if self.same_trx(transaction, resource) is States.xlock:
+                    cmds.extend(
+                        self.unlock(transaction, resource, States.xlock))
+                    cmds.extend(
+                        self.grant_next_locks(resource))
+                else:
+                    cmds.append(
+                        Command('not_locked_by', transaction, resource))
+
+        return cmds
+
+    def same_trx(self, transaction, resource):
+        return self.held_resources.get(resource, {}).get(transaction)
+
+    def resource_state(self, resource: str) -> States:
+        return list(self.held_resources.get(resource, {}).items())
+
+    def resource_mode(self, resource: str) -> States:
+        """Strongest lock currently held on the resource"""
+        held = self.held_resources.get(resource, {}).values()
+        for lock_type in (States.xlock, States.ulock, States.slock):
+            if lock_type in held:
+                return lock_type
+        return None
+
+    def pending_conversion(self, resource: str):
+        """(transaction, lock) of the U holder queued to convert to X, if any"""
+        fifo = self.resource_fifo.get(resource)
+        if fifo:
+            for transaction, lock_type in self.held_resources.get(resource, {}).items():
+                if lock_type is States.ulock and transaction in fifo:
+                    return transaction, lock_type
+        return None
+
+    def compatible(self, transaction: int, resource: str, lock_type: States) -> bool:
+        """Check lock_type against the locks held by the other transactions"""
+        return self.blocking_holder(transaction, resource, lock_type) is None
+
+    def blocking_holder(self, transaction: int, resource: str, lock_type: States):
+        """First (transaction, lock) held by another transaction that conflicts with lock_type"""
+        for other, held in self.held_resources.get(resource, {}).items():
+            if other != transaction and (held, lock_type) not in COMPATIBLE:
+                return other, held
+        return None
+
+    def lock_resource(self, transaction: int, resource: str, lock_type: States):
+        self.held_locks.setdefault(transaction, {})[
+            resource] = lock_type
+        self.held_resources.setdefault(
+            resource, {})[transaction] = lock_type
+        return [Command("granted", transaction, resource, lock_type)]
+
+    def upgrade(self, transaction: int, resource: str, lock_type: States):
+        self.held_locks[transaction][resource] = lock_type
+        self.held_resources[resource][transaction] = lock_type
+        return [Command('upgrade', transaction, resource, lock_type)]
+
+    def wait_for_lock(self, transaction: int, resource: str, next_lock_type: States, blocker=None):
+        old_transaction, old_lock_type = blocker or self.blocking_holder(
+            transaction, resource, next_lock_type)
+        self.resource_fifo.setdefault(resource, {})[
+            transaction] = next_lock_type
+
+        return [Command("waiting",
+                        transaction, resource, next_lock_type,
+                        extra={'lock_type': old_lock_type, 'transaction': old_transaction})]
+
+    def wait_for_lock_upgrade(self, transaction: int, resource: str, next_lock_type: States):
+        old_transaction, old_lock_type = self.blocking_holder(
+            transaction, resource, next_lock_type)
+        self.resource_fifo.setdefault(resource, {})[
+            transaction] = next_lock_type
+
+        return [Command("waiting_upgrade",
+                        transaction, resource, next_lock_type,
+                        extra={'lock_type': old_lock_type, 'transaction': old_transaction})]
+
+    def unlock(self, transaction: int, resource: str, lock_type: States):
+        del self.held_locks[transaction][resource]
+        del self.held_resources[resource][transaction]
+
+        return [Command('unlocked', transaction, resource, lock_type)]
+
+    def next_waiter(self, resource: str):
+        """Pending upgrades go first, they already hold the resource and
+           would otherwise deadlock against the waiters queued before them"""
+
+        held = self.held_resources.get(resource, {})
+        for transaction, lock_type in self.resource_fifo[resource].items():
+            if transaction in held:
+                return transaction, lock_type
+        return next(iter(self.resource_fifo[resource].items()))
+
+    def grant_next_locks(self, resource: str):
+        """ Grant all locks waiting (FIFO), there are three cases:
+           1. There are no locks waiting, or the next one conflicts with the
+              locks still held, so no one will be granted.
+           2. The following locks (one or more) are slock, in this case,
+              all these slock will be granted, until a conflicting lock is found or end of the list are reached.
+           3. The following lock is a xlock, in this case only this will be granted.
+        """
+
+        cmds = []
+        while len(self.resource_fifo.get(resource, {})) > 0:
+            transaction, lock_type = self.next_waiter(resource)
+
+            if not self.compatible(transaction, resource, lock_type):
+                break
+
+            # upgrade case
+            if self.held_resources.get(resource, {}).get(transaction):
+                cmds.append(
+                    Command("upgrade_to", transaction, resource, lock_type))
+            else:  # normal case
+                cmds.append(
+                    Command("granted_to", transaction, resource, lock_type))
+
+            self.held_resources.setdefault(resource, {})[
+                transaction] = lock_type
+            del self.resource_fifo[resource][transaction]
+            self.held_locks.setdefault(transaction, {})[
+                resource] = lock_type
+
+            # if the previous granted lock was xlock, no need to grant more
+            if lock_type is States.xlock:
+                break
+        return cmds
@@ -1,21 +1,63 @@
+import json
 import re
+import time
 from dataclasses import dataclass
 from enum import Enum
+from .cow import CowDict, cow_fork, detach_step, writable
+from .output import FORMATTERS, MAX_TRANSACTION, Output
+from .query import LockIndex
+from .ranges import IntervalTree, parse_range
 
 
 class Events(Enum):
     SLOCK = 'SLock'
+    ULOCK = 'ULock'
     XLOCK = 'XLock'
     UNLOCK = 'Unlock'
     START = 'Start'
     END = 'End'
 
 
+class Queries(Enum):
+    SHOW = 'Show'
+    WHO = 'Who'
+    WAITS = 'Waits'
+
+
 class States(Enum):
     slock = 'slocked'
+    ulock = 'ulocked'
     xlock = 'xlocked'
 
 
+# (held, requested) pairs that may coexist on the same resource,
+# U is compatible with S but not with another U, X is compatible with nothing
+COMPATIBLE = {
+    (States.slock, States.slock),
+    (States.slock, States.ulock),
+    (States.ulock, States.slock),
+}
+
+# Lock strength, a held lock covers the weaker requests
+STRENGTH = {States.slock: 0, States.ulock: 1, States.xlock: 2}
+
+LOCK_LETTER = {States.slock: 'S', States.ulock: 'U', States.xlock: 'X'}
+
+# LockManager dicts shared copy-on-write by fork(), and whether their values are dicts
+COW_STATE = {
+    'transactions': False,
+    'held_locks': True,
+    'resource_fifo': True,
+    'held_resources': True,
+    'held_ranges': True,
+    'range_fifo': False,
+}
+
+LOCK_TYPES = {Events.SLOCK: States.slock,
+              Events.ULOCK: States.ulock,
+              Events.XLOCK: States.xlock}
+
+
 @dataclass
 class Command:
     cmd: str
@@ -44,16 +86,77 @@ class LockManager:
     See see fsm-diagram.png graphs for design reference
     """
 
-    def __init__(self):
+    def __init__(self, clock=time.monotonic, output: str = 'text'):
+        self.clock = clock
+        self.output = Output(output)
         self.held_locks = {}
-        self.transactions = []
+        # started transactions, used as an ordered set
+        self.transactions = {}
         self.resource_fifo = {}
         self.held_resources = {}
+        # key range locks, indexed by interval and by transaction
+        self.ranges = IntervalTree()
+        self.held_ranges = {}
+        self.range_fifo = {}
+        # point resources in use, for range conflict checks,
+        # built on the first key range request
+        self.points = None
+        # secondary indexes for the query API
+        self.index = LockIndex(States)
+        self.frozen = False
+        # copying the state shared with a fork back to plain dicts
+        self.detaching = False
+
+    def fork(self) -> 'LockManager':
+        """Independent copy of the lock state, for what-if evaluation.
+
+        O(1): both lock managers keep sharing the current state through
+        copy-on-write dicts and persistent trees, and the fork only pays
+        for the entries it modifies afterwards. This lock manager detaches
+        its dicts from the shared state a few entries per request, so the
+        live request path goes back to plain dicts.
+        """
+
+        fork = LockManager.__new__(LockManager)
+        fork.clock = self.clock
+        fork.output = self.output
+        fork.frozen = False
+        fork.detaching = False
+        self.detaching = True
+        for name, copy_values in COW_STATE.items():
+            mine, theirs = cow_fork(getattr(self, name), copy_values)
+            setattr(self, name, mine)
+            setattr(fork, name, theirs)
+        fork.ranges = self.ranges.fork()
+        fork.points = self.points.fork() if self.points is not None else None
+        fork.index = self.index.fork()
+        return fork
+
+    def snapshot(self) -> 'LockManager':
+        """Read only fork, answers queries and can be forked again"""
+
+        snapshot = self.fork()
+        snapshot.frozen = True
+        return snapshot
+
+    def detach(self):
+        """One detach step of the state shared with the forks, see fork"""
+
+        detaching = self.index.detach()
+        for name in COW_STATE:
+            d = detach_step(getattr(self, name))
+            setattr(self, name, d)
+            detaching = detaching or type(d) is CowDict
+        self.detaching = detaching
 
     def process_request(self, request: str, transaction: int, resource: str = None) -> list[Command]:
         """Business logic, based in transaction and resource FSMs"""
 
         cmds = []
+        if self.frozen:
+            return [Command("read_only", transaction, resource)]
+        if self.detaching:
+            self.detach()
         try:
             req = Events(request)
         except ValueError:
@@ -62,9 +165,13 @@ class LockManager:
         # Transaction FSM
         if not resource:
             cmds.extend(self.transactionFSM(req, transaction))
+        # Range FSM
+        elif parse_range(resource):
+            cmds.extend(self.rangeFSM(req, transaction, resource))
         # Resource FSM
         else:
             cmds.extend(self.resourceFSM(req, transaction, resource))
+            self.index_point(resource)
 
         return cmds
 
@@ -76,7 +183,7 @@ class LockManager:
         # not_init state
         if transaction not in self.transactions:
             if req is Events.START:
-                self.transactions.append(transaction)
+                self.transactions[transaction] = None
                 cmds.append(Command('transaction_started', transaction))
             elif req is Events.END:
                 return [Command('not_started', transaction)]
@@ -85,48 +192,76 @@ class LockManager:
             if req is Events.END:
                 cmds.append(Command('transaction_ended', transaction))
 
+                # Clean waiting locks first, so they are not granted while releasing
+                for r in self.index.waiting_for(transaction):
+                    if transaction in self.resource_fifo.get(r, {}):
+                        del writable(self.resource_fifo, r)[transaction]
+                    self.range_fifo.pop((transaction, r), None)
+                    self.index.unwait(transaction, r)
+
                 # Unlock all resources that this transaction holds
                 locked_resources = list(
                     self.held_locks.get(transaction, {}).keys())
                 for r in locked_resources:
                     _cmds = self.process_request(
                         Events.UNLOCK, transaction, r)
-                    if 0 < len(_cmds):
-                        out = _cmds[0]
-                        cmds.append(
-                            Command(f"release_{out.cmd}", out.transaction, out.resource, out.lock_type))
-                    if 1 < len(_cmds):
-                        out = _cmds[1]
-                        cmds.append(
-                            Command(f"resource_{out.cmd}", out.transaction, out.resource, out.lock_type))
-
-                # Clean waiting locks
-                for xt in self.resource_fifo.values():
-                    if xt.get(transaction):
-                        del xt[transaction]
+                    cmds.extend(self.release_cmds(_cmds))
+
+                # Unlock all key ranges that this transaction holds
+                for r in list(self.held_ranges.get(transaction, {}).keys()):
+                    cmds.extend(self.release_cmds(
+                        self.process_request(Events.UNLOCK, transaction, r)))
 
                 # Finally remove tracking transaction
-                self.transactions.remove(transaction)
+                del self.transactions[transaction]
                 if self.held_locks.get(transaction):
                     del self.held_locks[transaction]
+                if transaction in self.held_ranges:
+                    del self.held_ranges[transaction]
             else:
                 return [Command('already_started', transaction)]
 
         return cmds
 
+    def release_cmds(self, cmds: list[Command]) -> list[Command]:
+        """Unlock commands, as reported when a transaction ends"""
+
+        out = []
+        if 0 < len(cmds):
+            cmd = cmds[0]
+            out.append(
+                Command(f"release_{cmd.cmd}", cmd.transaction, cmd.resource, cmd.lock_type))
+        for cmd in cmds[1:]:
+            out.append(
+                Command(f"resource_{cmd.cmd}", cmd.transaction, cmd.resource, cmd.lock_type))
+        return out
+
     def resourceFSM(self, req, transaction, resource):
         """see fsm-diagram.png/resource FSM for design reference"""
 
         cmds = []
+        mode = self.resource_mode(resource)
 
         if transaction not in self.transactions:
             return [Command("not_found", transaction, resource)]
 
+        # blocked by a key range locked by other transaction
+        elif req in LOCK_TYPES and self.range_holder(transaction, resource, resource + '\0', LOCK_TYPES[req]):
+            if self.same_trx(transaction, resource):
+                cmds.extend(
+                    self.wait_for_lock_upgrade(transaction, resource, LOCK_TYPES[req]))
+            else:
+                cmds.extend(
+                    self.wait_for_lock(transaction, resource, LOCK_TYPES[req]))
+
         # unlocked state
-        elif not self.resource_state(resource):
+        elif mode is None:
             if req is Events.SLOCK:
                 cmds.extend(
                     self.lock_resource(transaction, resource, States.slock))
+            elif req is Events.ULOCK:
+                cmds.extend(
+                    self.lock_resource(transaction, resource, States.ulock))
             elif req is Events.XLOCK:
                 cmds.extend(
                     self.lock_resource(transaction, resource, States.xlock))
@@ -135,17 +270,25 @@ class LockManager:
                     Command('not_locked', transaction, resource))
 
         # slocked superstate
-        elif self.resource_state(resource)[0][1] is States.slock:
+        elif mode is States.slock:
 
             # other cases of slocked superstate
             if req is Events.SLOCK:
                 if self.same_trx(transaction, resource):
                     cmds.append(
                         Command('already_held', transaction, resource, States.slock))
+            elif req is Events.ULOCK:
+                # no update lock is held yet, so it is granted right away
+                if self.same_trx(transaction, resource):
+                    cmds.extend(
+                        self.upgrade(transaction, resource, States.ulock))
+                else:
+                    cmds.extend(
+                        self.lock_resource(transaction, resource, States.ulock))
             elif req is Events.XLOCK:
                 if not self.same_trx(transaction, resource):
                     cmds.extend(
-                        self.wait_for_lock(transaction, resource, States.slock, States.xlock))
+                        self.wait_for_lock(transaction, resource, States.xlock))
             elif req is Events.UNLOCK:
                 if not self.same_trx(transaction, resource):
                     cmds.append(
@@ -159,10 +302,8 @@ class LockManager:
                             self.lock_resource(transaction, resource, States.slock))
                 elif req is Events.XLOCK:
                     if self.same_trx(transaction, resource):
-                        self.held_locks[transaction][resource] = States.xlock
-                        self.held_resources[resource][transaction] = States.xlock
-                        cmds.append(
-                            Command('upgrade', transaction, resource))
+                        cmds.extend(
+                            self.upgrade(transaction, resource, States.xlock))
                 elif req is Events.UNLOCK:
                     if self.same_trx(transaction, resource):
                         cmds.extend(
@@ -179,29 +320,70 @@ class LockManager:
                 elif req is Events.XLOCK:
                     if self.same_trx(transaction, resource):
                         cmds.extend(
-                            self.wait_for_lock_upgrade(transaction, resource, States.slock, States.xlock))
+                            self.wait_for_lock_upgrade(transaction, resource, States.xlock))
                 elif req is Events.UNLOCK:
                     if self.same_trx(transaction, resource):
                         cmds.extend(
                             self.unlock(transaction, resource, States.slock))
                         cmds.extend(
                             self.grant_next_locks(resource))
-        # xlocked state
-        elif self.resource_state(resource)[0][1] is States.xlock:
+
+        # ulocked superstate, a single U holder along with zero or more S holders
+        elif mode is States.ulock:
+            held = self.same_trx(transaction, resource)
+            converting = self.pending_conversion(resource)
             if req is Events.SLOCK:
-                if self.same_trx(transaction, resource):
+                if held:
                     cmds.append(
                         Command('already_held', transaction, resource, States.slock))
+                elif converting:
+                    # new readers queue behind the conversion, so they cannot starve it
+                    cmds.extend(
+                        self.wait_for_lock(transaction, resource, States.slock, converting))
+                else:
+                    cmds.extend(
+                        self.lock_resource(transaction, resource, States.slock))
+            elif req is Events.ULOCK:
+                if held is States.ulock:
+                    cmds.append(
+                        Command('already_held', transaction, resource, States.ulock))
+                elif held:
+                    cmds.extend(
+                        self.wait_for_lock_upgrade(transaction, resource, States.ulock))
                 else:
                     cmds.extend(
-                        self.wait_for_lock(transaction, resource, States.xlock, States.slock))
+                        self.wait_for_lock(transaction, resource, States.ulock))
             elif req is Events.XLOCK:
+                # U holder converts to X as soon as the other readers drain
+                if held is States.ulock and len(self.resource_state(resource)) == 1:
+                    cmds.extend(
+                        self.upgrade(transaction, resource, States.xlock))
+                elif held:
+                    cmds.extend(
+                        self.wait_for_lock_upgrade(transaction, resource, States.xlock))
+                else:
+                    cmds.extend(
+                        self.wait_for_lock(transaction, resource, States.xlock))
+            elif req is Events.UNLOCK:
+                if held:
+                    cmds.extend(
+                        self.unlock(transaction, resource, held))
+                    cmds.extend(
+                        self.grant_next_locks(resource))
+                else:
+                    cmds.append(
+                        Command('not_locked_by', transaction, resource))
+
+        # xlocked state
+        elif mode is States.xlock:
+            if req in LOCK_TYPES:
+                lock_type = LOCK_TYPES[req]
                 if self.same_trx(transaction, resource):
                     cmds.append(
-                        Command('already_held', transaction, resource, States.xlock))
+                        Command('already_held', transaction, resource, lock_type))
                 else:
                     cmds.extend(
-                        self.wait_for_lock(transaction, resource, States.xlock, States.xlock))
+                        self.wait_for_lock(transaction, resource, lock_type))
             if req is Events.UNLOCK:
                 if self.same_trx(transaction, resource) is States.xlock:
                     cmds.extend(
@@ -220,71 +402,335 @@ class LockManager:
     def resource_state(self, resource: str) -> States:
         return list(self.held_resources.get(resource, {}).items())
 
+    def resource_mode(self, resource: str) -> States:
+        """Strongest lock currently held on the resource"""
+        held = self.held_resources.get(resource, {}).values()
+        for lock_type in (States.xlock, States.ulock, States.slock):
+            if lock_type in held:
+                return lock_type
+        return None
+
+    def pending_conversion(self, resource: str):
+        """(transaction, lock) of the U holder queued to convert to X, if any"""
+        fifo = self.resource_fifo.get(resource)
+        if fifo:
+            for transaction, lock_type in self.held_resources.get(resource, {}).items():
+                if lock_type is States.ulock and transaction in fifo:
+                    return transaction, lock_type
+        return None
+
+    def compatible(self, transaction: int, resource: str, lock_type: States) -> bool:
+        """Check lock_type against the locks held by the other transactions"""
+        return self.blocking_holder(transaction, resource, lock_type) is None
+
+    def blocking_holder(self, transaction: int, resource: str, lock_type: States):
+        """First (transaction, lock) held by another transaction that conflicts with lock_type"""
+        for other, held in self.held_resources.get(resource, {}).items():
+            if other != transaction and (held, lock_type) not in COMPATIBLE:
+                return other, held
+        return self.range_holder(transaction, resource, resource + '\0', lock_type)
+
     def lock_resource(self, transaction: int, resource: str, lock_type: States):
-        self.held_locks.setdefault(transaction, {})[
+        writable(self.held_locks, transaction, {})[
             resource] = lock_type
-        self.held_resources.setdefault(
-            resource, {})[transaction] = lock_type
+        writable(self.held_resources, resource, {})[
+            transaction] = lock_type
+        self.index.hold(transaction, resource, lock_type)
         return [Command("granted", transaction, resource, lock_type)]
 
-    def wait_for_lock(self, transaction: int, resource: str, old_lock_type: States, next_lock_type: States):
-        old_transaction = self.resource_state(resource)[0][0]
-        self.resource_fifo.setdefault(resource, {})[
+    def upgrade(self, transaction: int, resource: str, lock_type: States):
+        writable(self.held_locks, transaction)[resource] = lock_type
+        writable(self.held_resources, resource)[transaction] = lock_type
+        self.index.hold(transaction, resource, lock_type)
+        return [Command('upgrade', transaction, resource, lock_type)]
+
+    def wait_for_lock(self, transaction: int, resource: str, next_lock_type: States, blocker=None):
+        old_transaction, old_lock_type = blocker or self.blocking_holder(
+            transaction, resource, next_lock_type)
+        writable(self.resource_fifo, resource, {})[
             transaction] = next_lock_type
+        self.index.wait(transaction, resource, next_lock_type, self.clock())
 
         return [Command("waiting",
                         transaction, resource, next_lock_type,
                         extra={'lock_type': old_lock_type, 'transaction': old_transaction})]
 
-    def wait_for_lock_upgrade(self, transaction: int, resource: str, old_lock_type: States, next_lock_type: States):
-        old_transaction = self.resource_state(resource)[1][0]
-        self.resource_fifo.setdefault(resource, {})[transaction] = States.xlock
+    def wait_for_lock_upgrade(self, transaction: int, resource: str, next_lock_type: States):
+        old_transaction, old_lock_type = self.blocking_holder(
+            transaction, resource, next_lock_type)
+        writable(self.resource_fifo, resource, {})[
+            transaction] = next_lock_type
+        self.index.wait(transaction, resource, next_lock_type, self.clock())
 
         return [Command("waiting_upgrade",
                         transaction, resource, next_lock_type,
                         extra={'lock_type': old_lock_type, 'transaction': old_transaction})]
 
     def unlock(self, transaction: int, resource: str, lock_type: States):
-        del self.held_locks[transaction][resource]
-        del self.held_resources[resource][transaction]
+        del writable(self.held_locks, transaction)[resource]
+        del writable(self.held_resources, resource)[transaction]
+        self.index.release(transaction, resource)
 
         return [Command('unlocked', transaction, resource, lock_type)]
 
+    def next_waiter(self, resource: str):
+        """Pending upgrades go first, they already hold the resource and
+           would otherwise deadlock against the waiters queued before them"""
+
+        held = self.held_resources.get(resource, {})
+        for transaction, lock_type in self.resource_fifo[resource].items():
+            if transaction in held:
+                return transaction, lock_type
+        return next(iter(self.resource_fifo[resource].items()))
+
     def grant_next_locks(self, resource: str):
         """ Grant all locks waiting (FIFO), there are three cases:
-           1. There are no locks waiting, so no one will be granted.
+           1. There are no locks waiting, or the next one conflicts with the
+              locks still held, so no one will be granted.
            2. The following locks (one or more) are slock, in this case,
-              all these slock will be granted, until a xlock is found or end of the list are reached.
+              all these slock will be granted, until a conflicting lock is found or end of the list are reached.
            3. The following lock is a xlock, in this case only this will be granted.
         """
 
         cmds = []
         while len(self.resource_fifo.get(resource, {})) > 0:
-            transaction, lock_type = list(
-                self.resource_fifo[resource].items())[0]
+            transaction, lock_type = self.next_waiter(resource)
+
+            if not self.compatible(transaction, resource, lock_type):
+                break
 
             # upgrade case
-            if self.held_resources.get(resource).get(transaction) is States.slock:
+            if self.held_resources.get(resource, {}).get(transaction):
                 cmds.append(
-                    Command("upgrade_to", transaction))
+                    Command("upgrade_to", transaction, resource, lock_type))
             else:  # normal case
                 cmds.append(
                     Command("granted_to", transaction, resource, lock_type))
 
-            self.held_resources.setdefault(resource, {})[
+            writable(self.held_resources, resource, {})[
                 transaction] = lock_type
-            del self.resource_fifo[resource][transaction]
-            self.held_locks.setdefault(transaction, {})[
+            del writable(self.resource_fifo, resource)[transaction]
+            writable(self.held_locks, transaction, {})[
                 resource] = lock_type
+            self.index.unwait(transaction, resource)
+            self.index.hold(transaction, resource, lock_type)
 
             # if the previous granted lock was xlock, no need to grant more
             if lock_type is States.xlock:
                 break
+
+        self.index_point(resource)
+        if self.range_fifo:
+            cmds.extend(self.grant_range_locks())
         return cmds
 
+    def rangeFSM(self, req, transaction, resource):
+        """Key range locks, conflicts are checked against the interval index
+           and the sorted point resources instead of scanning held_resources"""
+
+        cmds = []
+        lo, hi = parse_range(resource)
+        held = self.held_ranges.get(transaction, {}).get(resource)
+
+        if transaction not in self.transactions:
+            return [Command("not_found", transaction, resource)]
+
+        elif lo >= hi:
+            return [Command("cmd_not_valid", transaction, resource)]
+
+        elif req is Events.UNLOCK:
+            if held:
+                cmds.extend(
+                    self.unlock_range(transaction, resource, held))
+            else:
+                cmds.append(
+                    Command('not_locked', transaction, resource))
+
+        elif req in LOCK_TYPES:
+            lock_type = LOCK_TYPES[req]
+            blocker = self.range_blocker(transaction, lo, hi, lock_type)
+            if held and STRENGTH[held] >= STRENGTH[lock_type]:
+                cmds.append(
+                    Command('already_held', transaction, resource, lock_type))
+            elif blocker:
+                self.range_fifo[(transaction, resource)] = lock_type
+                self.index.wait(transaction, resource, lock_type, self.clock())
+                cmds.append(
+                    Command("waiting_upgrade" if held else "waiting",
+                            transaction, resource, lock_type,
+                            extra={'lock_type': blocker[1], 'transaction': blocker[0]}))
+            else:
+                self.lock_range(transaction, resource, lock_type)
+                cmds.append(
+                    Command('upgrade' if held else 'granted', transaction, resource, lock_type))
+
+        return cmds
+
+    def range_holder(self, transaction: int, lo: str, hi: str, lock_type: States):
+        """First (transaction, lock) from other transaction's key ranges overlapping [lo, hi)
+           that conflicts with lock_type"""
+
+        if not len(self.ranges):
+            return None
+        for _, _, other, (_, held) in self.ranges.overlapping(lo, hi):
+            if other != transaction and (held, lock_type) not in COMPATIBLE:
+                return other, held
+        return None
+
+    def range_blocker(self, transaction: int, lo: str, hi: str, lock_type: States):
+        """Conflicting holder in [lo, hi), either a key range or a point resource"""
+
+        blocker = self.range_holder(transaction, lo, hi, lock_type)
+        if blocker:
+            return blocker
+        for key, _, _, _ in self.point_index().overlapping(lo, hi):
+            for other, held in self.held_resources.get(key, {}).items():
+                if other != transaction and (held, lock_type) not in COMPATIBLE:
+                    return other, held
+        return None
+
+    def lock_range(self, transaction: int, resource: str, lock_type: States):
+        lo, hi = parse_range(resource)
+        self.ranges.insert(lo, hi, transaction, (resource, lock_type))
+        writable(self.held_ranges, transaction, {})[resource] = lock_type
+        self.index.hold(transaction, resource, lock_type)
+
+    def unlock_range(self, transaction: int, resource: str, lock_type: States):
+        lo, hi = parse_range(resource)
+        self.ranges.remove(lo, hi, transaction)
+        del writable(self.held_ranges, transaction)[resource]
+        self.index.release(transaction, resource)
+
+        cmds = [Command('unlocked', transaction, resource, lock_type)]
+        # point resources waiting inside the released range
+        for key in [key for key, _, _, _ in self.point_index().overlapping(lo, hi)]:
+            if self.resource_fifo.get(key):
+                cmds.extend(self.grant_next_locks(key))
+        cmds.extend(self.grant_range_locks())
+        return cmds
+
+    def grant_range_locks(self):
+        """Grant waiting key range locks (FIFO) that no longer conflict"""
+
+        cmds = []
+        for (transaction, resource), lock_type in list(self.range_fifo.items()):
+            lo, hi = parse_range(resource)
+            if self.range_blocker(transaction, lo, hi, lock_type):
+                continue
+
+            upgrade = resource in self.held_ranges.get(transaction, {})
+            del self.range_fifo[(transaction, resource)]
+            self.index.unwait(transaction, resource)
+            self.lock_range(transaction, resource, lock_type)
+            cmds.append(
+                Command("upgrade_to" if upgrade else "granted_to", transaction, resource, lock_type))
+        return cmds
+
+    def point_index(self) -> IntervalTree:
+        """Point resources held or waited for, as [key, key] intervals"""
+
+        if self.points is None:
+            self.points = IntervalTree()
+            for resource in set(self.held_resources) | set(self.resource_fifo):
+                self.index_point(resource)
+        return self.points
+
+    def index_point(self, resource: str):
+        """Keep the point index up to date, once it has been built"""
+
+        if self.points is None:
+            return
+        indexed = self.points.get(resource, resource + '\0', resource)
+        in_use = self.held_resources.get(resource) or self.resource_fifo.get(resource)
+        if in_use and not indexed:
+            self.points.insert(resource, resource + '\0', resource, True)
+        elif not in_use and indexed:
+            self.points.remove(resource, resource + '\0', resource)
+
+    def holders(self, resource: str) -> list:
+        """(transaction, resource, lock_type) of the locks overlapping the resource,
+           both single keys and key ranges"""
+
+        bounds = parse_range(resource)
+        lo, hi = bounds or (resource, resource + '\0')
+        out = [(t, r, lock_type) for _, _, t, (r, lock_type) in self.ranges.overlapping(lo, hi)]
+        keys = [key for key, _, _, _ in self.point_index().overlapping(lo, hi)] \
+            if bounds else [resource]
+        for key in keys:
+            out.extend((t, key, lock_type)
+                       for t, lock_type in self.held_resources.get(key, {}).items())
+        return out
+
+    def waiting_for(self, transaction: int) -> dict:
+        """Resources the transaction is waiting for, with the requested lock"""
+        return self.index.waiting_for(transaction)
+
+    def waits_older_than(self, age: float) -> list:
+        """(transaction, resource, lock_type, since) of the waits older than age, oldest first"""
+        return self.index.waits_since(self.clock() - age)
+
+    def holding(self, lock_type: States) -> list:
+        """(transaction, resource) pairs holding a lock of this type"""
+        return self.index.holding(lock_type)
+
+    def dump(self):
+        """Snapshot of the live lock state as JSON Lines.
+
+        The state is copied when called, so the snapshot stays consistent
+        while the lines are consumed.
+        """
+
+        transactions = list(self.transactions)
+        held = list(self.index.held.items())
+        waits = list(self.index.waits.items())
+
+        def lines():
+            for t in transactions:
+                yield json.dumps({'type': 'transaction', 'transaction': t})
+            for (t, r), lock_type in held:
+                yield json.dumps({'type': 'held', 'transaction': t, 'resource': r,
+                                  'lock_type': lock_type.value})
+            for (t, r), (lock_type, since) in waits:
+                yield json.dumps({'type': 'waiting', 'transaction': t, 'resource': r,
+                                  'lock_type': lock_type.value, 'since': since})
+        return lines()
+
+    def process_query(self, request: str, arg: str = None) -> list[Command]:
+        """Introspection over live lock state, served from the secondary indexes"""
+
+        query = Queries(request)
+        now = self.clock()
+
+        if query is Queries.SHOW and not arg:
+            cmds = [Command('holder', t, r, lock_type)
+                    for (t, r), lock_type in self.index.held.items()]
+            cmds.extend(Command('waits_for', t, r, lock_type, extra={'age': now - since})
+                        for (t, r), (lock_type, since) in self.index.waits.items())
+            return cmds or [Command('no_locks')]
+
+        elif query is Queries.WHO and arg:
+            return [Command('holder', t, r, lock_type) for t, r, lock_type in self.holders(arg)] \
+                or [Command('not_held', resource=arg)]
+
+        elif query is Queries.WAITS and not arg:
+            return [Command('waits_for', t, r, lock_type, extra={'age': now - since})
+                    for t, r, lock_type, since in self.index.waits_since(now)] \
+                or [Command('no_waits')]
+
+        elif query is Queries.WAITS and arg.isdigit():
+            transaction = int(arg)
+            return [Command('waits_for', transaction, r, lock_type,
+                            extra={'age': now - self.index.waits[(transaction, r)][1]})
+                    for r, lock_type in self.waiting_for(transaction).items()] \
+                or [Command('not_waiting', transaction)]
+
+        return [Command('cmd_not_valid', resource=arg)]
+
     def commands_mapping(self, cmd: Command):
         """Out Adapter for the commands returned from business logic"""
 
+        def letter(lock_type): return LOCK_LETTER.get(lock_type, 'X')
+
         mapping = {
             'cmd_not_valid': lambda cmd: IndexError("Command not valid"),
             'transaction_started': lambda cmd: f"Start {cmd.transaction} : Transaction {cmd.transaction} started",
@@ -292,19 +738,27 @@ class LockManager:
             'not_started': lambda cmd: ValueError(f"Transaction {cmd.transaction} not started"),
             'already_started': lambda cmd: ValueError(f"Transaction {cmd.transaction} already started"),
             'not_found': lambda cmd: ValueError("Transaction not found"),
-            'granted': lambda cmd: f"{'SLock' if cmd.lock_type is States.slock else 'XLock'} {cmd.transaction} {cmd.resource}: Lock granted",
-            'granted_to': lambda cmd: f"{'S-Lock' if cmd.lock_type is States.slock else 'X-Lock'} granted to {cmd.transaction}",
-            'upgrade': lambda cmd: f"Upgraded to XL granted",
-            'upgrade_to': lambda cmd: f"Upgraded to XL granted to {cmd.transaction}",
-            'waiting_upgrade': lambda cmd: f"Waiting for lock upgrade (S-lock held by: {cmd.extra['transaction']})",
-            'resource_granted_to': lambda cmd: f"{'S-Lock' if cmd.lock_type is States.slock else 'X-Lock'} on {cmd.resource} granted to {cmd.transaction}",
+            'granted': lambda cmd: f"{letter(cmd.lock_type)}Lock {cmd.transaction} {cmd.resource}: Lock granted",
+            'granted_to': lambda cmd: f"{letter(cmd.lock_type)}-Lock granted to {cmd.transaction}",
+            'upgrade': lambda cmd: f"Upgraded to {letter(cmd.lock_type)}L granted",
+            'upgrade_to': lambda cmd: f"Upgraded to {letter(cmd.lock_type)}L granted to {cmd.transaction}",
+            'waiting_upgrade': lambda cmd: f"Waiting for lock upgrade ({letter(cmd.extra['lock_type'])}-lock held by: {cmd.extra['transaction']})",
+            'resource_granted_to': lambda cmd: f"{letter(cmd.lock_type)}-Lock on {cmd.resource} granted to {cmd.transaction}",
+            'resource_upgrade_to': lambda cmd: f"Upgraded to {letter(cmd.lock_type)}L on {cmd.resource} granted to {cmd.transaction}",
             'unlocked': lambda cmd: f"Unlock {cmd.transaction} {cmd.resource}: Lock released",
-            'already_held': lambda cmd: ValueError(f"{'SLock' if cmd.lock_type is States.slock else 'XLock'} {cmd.transaction} {cmd.resource}: Lock already held"),
-            'release_unlocked': lambda cmd: f"Release {'S-lock' if cmd.lock_type is States.slock else 'X-lock'} on {cmd.resource}",
+            'already_held': lambda cmd: ValueError(f"{letter(cmd.lock_type)}Lock {cmd.transaction} {cmd.resource}: Lock already held"),
+            'release_unlocked': lambda cmd: f"Release {letter(cmd.lock_type)}-lock on {cmd.resource}",
             'not_locked': lambda cmd: ValueError(f"Cannot unlock {cmd.resource}, not locked"),
             'not_locked_by': lambda cmd: ValueError(f"Cannot unlock {cmd.resource}, not locked by this transaction"),
-            "waiting": lambda cmd: f"{'SLock' if cmd.lock_type is States.slock else 'XLock'} {cmd.transaction} {cmd.resource}: " +
-            f"Waiting for lock ({'S-lock' if cmd.extra['lock_type'] is States.slock else 'X-lock'} held by: {cmd.extra['transaction']})",
+            'holder': lambda cmd: f"{cmd.resource}: {letter(cmd.lock_type)}-lock held by {cmd.transaction}",
+            'not_held': lambda cmd: f"{cmd.resource}: not locked",
+            'waits_for': lambda cmd: f"{cmd.transaction}: waiting for {letter(cmd.lock_type)}-lock on {cmd.resource} ({cmd.extra['age']:.3f}s)",
+            'not_waiting': lambda cmd: f"{cmd.transaction}: not waiting",
+            'no_waits': lambda cmd: "No transaction waiting",
+            'no_locks': lambda cmd: "No locks held",
+            'read_only': lambda cmd: ValueError("Snapshot is read only, fork it to process requests"),
+            "waiting": lambda cmd: f"{letter(cmd.lock_type)}Lock {cmd.transaction} {cmd.resource}: " +
+            f"Waiting for lock ({letter(cmd.extra['lock_type'])}-lock held by: {cmd.extra['transaction']})",
         }
 
         out_cmd = mapping[cmd.cmd](cmd)
@@ -313,18 +767,44 @@ class LockManager:
         else:
             return out_cmd
 
-    def process_request_str(self, request_str: str) -> list[str]:
-        """Adapter for business logic, IN/OUT conversion"""
+    def process_request_cmds(self, request_str: str) -> list[Command]:
+        """IN adapter only, for callers that want the Command objects without formatting"""
 
         # Using regex groups
-        pattern = r"^(\w+) (\d+) ?(\w+)?_*$"
+        pattern = r"^(\w+) (\d+) ?(\[\w+,\w+[)\]]|\w+\*?)?_*$"
         match = re.search(pattern, request_str)
-
-        if match:
+        query_pattern = r"^(Show|Who|Waits) ?(\[\w+,\w+[)\]]|\w+\*?)?$"
+        query = re.search(query_pattern, request_str)
+
+        # binary records store the transaction as int64, don't apply a request
+        # that could only be reported as cmd_not_valid
+        number = match.group(2) if match else query.group(2) if query else None
+        if self.output is Output.BINARY and number and number.isdigit() and int(number) > MAX_TRANSACTION:
+            raise IndexError(f"Transaction {number} doesn't fit in a binary record")
+
+        if query:
+            return self.process_query(*query.groups())
+        elif match:
             request, transaction, resource = match.groups()
-            outs = self.process_request(request, int(transaction), resource)
-            # Joining commands in newlines
-            return "\n".join([self.commands_mapping(out) for out in outs])
+            return self.process_request(request, int(transaction), resource)
         else:
             raise IndexError(
                 f"Text '{request_str}' doesn't match expected format: request transaction <resource>")
+
+    def process_request_str(self, request_str: str) -> str:
+        """Adapter for business logic, IN/OUT conversion
+
+        Text output raises the errors, the structured outputs (jsonl, tsv, binary)
+        report them as records instead. Binary output is returned as bytes.
+        """
+
+        if self.output is Output.TEXT:
+            outs = self.process_request_cmds(request_str)
+            # Joining commands in newlines
+            return "\n".join([self.commands_mapping(out) for out in outs])
+
+        try:
+            outs = self.process_request_cmds(request_str)
+        except IndexError:
+            outs = [Command("cmd_not_valid", extra={'input': request_str})]
+        return FORMATTERS[self.output](outs)
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""Discrete-event simulator to predict throughput under locking policies.
+
+Drives a LockManager with virtual time: a fixed number of clients run
+transactions back to back, each one locks its resources one at a time with
+think times in between, holds them for a while and commits (End). Lock
+waits longer than lock_timeout abort the transaction, which is retried
+after a random backoff.
+
+Usage:
+    PYTHONPATH=./src python -m lock_manager.simulator [workload.json]
+"""
+import heapq
+import json
+import math
+import random
+import sys
+from dataclasses import dataclass, field, asdict
+from .simple import LockManager, Events
+
+# event kinds
+NEXT = 0
+COMMIT = 1
+TIMEOUT = 2
+RESTART = 3
+
+GRANTS = {'granted_to', 'upgrade_to', 'resource_granted_to', 'resource_upgrade_to'}
+
+
+@dataclass
+class Workload:
+    """Workload spec, times are in simulated seconds"""
+
+    clients: int = 10
+    transactions: int = 1000
+    resources: int = 100
+    # zipf exponent of the resource popularity, 0 is uniform
+    skew: float = 0.0
+    locks_per_transaction: int = 4
+    write_ratio: float = 0.2
+    # reads that are later upgraded to XLock on the same resource (read-modify-write)
+    upgrade_ratio: float = 0.0
+    # lock requested for the read-modify-write reads, SLock or ULock
+    update_lock: str = 'SLock'
+    # means of the exponential think and hold times
+    think_time: float = 0.001
+    hold_time: float = 0.005
+    lock_timeout: float = 0.1
+    max_retries: int = 10
+    retry_backoff: float = 0.01
+    seed: int = 0
+
+    @classmethod
+    def from_file(cls, path: str) -> 'Workload':
+        with open(path) as f:
+            return cls(**json.load(f))
+
+
+@dataclass
+class Report:
+    committed: int = 0
+    aborted: int = 0
+    failed: int = 0
+    events: int = 0
+    lock_requests: int = 0
+    elapsed: float = 0.0
+    throughput: float = 0.0
+    avg_wait: float = 0.0
+    p99_wait: float = 0.0
+    # resource -> (time weighted average, max) waiting queue length
+    queue_lengths: dict = field(default_factory=dict)
+
+    def summary(self) -> str:
+        busiest = sorted(self.queue_lengths.items(), key=lambda q: -q[1][0])[:5]
+        return "\n".join([
+            f"Committed: {self.committed} ({self.throughput:.1f} txn/s)",
+            f"Aborted: {self.aborted}, failed after retries: {self.failed}",
+            f"Wait: avg {self.avg_wait * 1000:.3f}ms, p99 {self.p99_wait * 1000:.3f}ms",
+            f"Simulated: {self.elapsed:.3f}s, {self.events} events, {self.lock_requests} lock requests",
+            "Busiest queues: " + ", ".join(f"{r} avg {avg:.2f} max {top}" for r, (avg, top) in busiest),
+        ])
+
+
+class _Client:
+    __slots__ = ('transaction', 'plan', 'step', 'attempt', 'waiting', 'wait_start', 'token')
+
+    def __init__(self):
+        self.transaction = None
+        self.plan = None
+        self.step = 0
+        self.attempt = 0
+        self.waiting = None
+        self.wait_start = 0.0
+        self.token = 0
+
+
+class Simulator:
+    """
+    Runs a Workload against a fresh LockManager.
+
+    Events live in a binary heap ordered by (time, sequence), the sequence
+    keeps ties in FIFO order so runs are reproducible for a given seed.
+    """
+
+    def __init__(self, workload: Workload, lock_manager: LockManager = None):
+        self.workload = workload
+        self.now = 0.0
+        self.lm = lock_manager or LockManager(clock=lambda: self.now)
+        self.rnd = random.Random(workload.seed)
+        self.heap = []
+        self.seq = 0
+        self.next_transaction = 1
+        self.clients = {}
+        self.started = 0
+        self.report = Report()
+        self.waits = []
+        # resource -> [queue length, time weighted area, last change, max]
+        self.queues = {}
+
+        self.names = [f"R{i}" for i in range(workload.resources)]
+        weights = [1 / (i + 1) ** workload.skew for i in range(workload.resources)]
+        self.cum_weights = [0.0] * len(weights)
+        total = 0.0
+        for i, w in enumerate(weights):
+            total += w
+            self.cum_weights[i] = total
+        self.update_event = Events(workload.update_lock)
+
+    def schedule(self, delay: float, kind: int, client: _Client, token: int = 0):
+        self.seq += 1
+        heapq.heappush(self.heap, (self.now + delay, self.seq, kind, client, token))
+
+    def think(self, mean: float) -> float:
+        return self.rnd.expovariate(1 / mean) if mean > 0 else 0.0
+
+    def make_plan(self) -> list:
+        w = self.workload
+        resources = self.rnd.choices(self.names, cum_weights=self.cum_weights, k=w.locks_per_transaction)
+        plan = []
+        for r in dict.fromkeys(resources):
+            p = self.rnd.random()
+            if p < w.write_ratio:
+                plan.append((Events.XLOCK, r))
+            elif p < w.write_ratio + w.upgrade_ratio:
+                plan.append((self.update_event, r))
+                plan.append((Events.XLOCK, r))
+            else:
+                plan.append((Events.SLOCK, r))
+        return plan
+
+    def run(self) -> Report:
+        for _ in range(min(self.workload.clients, self.workload.transactions)):
+            client = _Client()
+            self.started += 1
+            self.begin(client, self.make_plan())
+
+        heap = self.heap
+        report = self.report
+        while heap:
+            self.now, _, kind, client, token = heapq.heappop(heap)
+            report.events += 1
+            if kind == NEXT:
+                self.request(client)
+            elif kind == COMMIT:
+                self.commit(client)
+            elif kind == TIMEOUT:
+                if client.waiting is not None and client.token == token:
+                    self.abort(client)
+            elif kind == RESTART:
+                self.begin(client, client.plan)
+
+        return self.finish()
+
+    def begin(self, client: _Client, plan: list):
+        client.transaction = self.next_transaction
+        self.next_transaction += 1
+        client.plan = plan
+        client.step = 0
+        self.clients[client.transaction] = client
+        self.lm.process_request(Events.START, client.transaction)
+        self.schedule(self.think(self.workload.think_time), NEXT, client)
+
+    def request(self, client: _Client):
+        event, resource = client.plan[client.step]
+        self.report.lock_requests += 1
+        cmds = self.lm.process_request(event, client.transaction, resource)
+        if cmds and cmds[0].cmd in ('waiting', 'waiting_upgrade'):
+            client.waiting = resource
+            client.wait_start = self.now
+            client.token += 1
+            self.queue_changed(resource, 1)
+            self.schedule(self.workload.lock_timeout, TIMEOUT, client, client.token)
+        else:
+            self.advance(client)
+
+    def advance(self, client: _Client):
+        client.step += 1
+        if client.step < len(client.plan):
+            self.schedule(self.think(self.workload.think_time), NEXT, client)
+        else:
+            self.schedule(self.think(self.workload.hold_time), COMMIT, client)
+
+    def wake(self, cmds: list):
+        """Resume the clients whose waiting locks were granted"""
+
+        for cmd in cmds:
+            if cmd.cmd in GRANTS:
+                client = self.clients.get(cmd.transaction)
+                if client is not None and client.waiting is not None:
+                    self.queue_changed(client.waiting, -1)
+                    self.waits.append(self.now - client.wait_start)
+                    client.waiting = None
+                    self.advance(client)
+
+    def end(self, client: _Client):
+        del self.clients[client.transaction]
+        self.wake(self.lm.process_request(Events.END, client.transaction))
+
+    def commit(self, client: _Client):
+        self.end(client)
+        self.report.committed += 1
+        client.attempt = 0
+        self.next_transaction_for(client)
+
+    def abort(self, client: _Client):
+        self.queue_changed(client.waiting, -1)
+        self.waits.append(self.now - client.wait_start)
+        client.waiting = None
+        self.end(client)
+        self.report.aborted += 1
+        client.attempt += 1
+        if client.attempt <= self.workload.max_retries:
+            self.schedule(self.rnd.uniform(0, self.workload.retry_backoff * client.attempt), RESTART, client)
+        else:
+            self.report.failed += 1
+            client.attempt = 0
+            self.next_transaction_for(client)
+
+    def next_transaction_for(self, client: _Client):
+        if self.started < self.workload.transactions:
+            self.started += 1
+            self.begin(client, self.make_plan())
+
+    def queue_changed(self, resource: str, delta: int):
+        queue = self.queues.get(resource)
+        if queue is None:
+            queue = self.queues[resource] = [0, 0.0, self.now, 0]
+        queue[1] += queue[0] * (self.now - queue[2])
+        queue[2] = self.now
+        queue[0] += delta
+        if queue[0] > queue[3]:
+            queue[3] = queue[0]
+
+    def finish(self) -> Report:
+        report = self.report
+        report.elapsed = self.now
+        if self.now > 0:
+            report.throughput = report.committed / self.now
+
+        if report.lock_requests:
+            report.avg_wait = sum(self.waits) / report.lock_requests
+            # requests granted right away waited 0, before every recorded wait
+            self.waits.sort()
+            rank = math.ceil(0.99 * report.lock_requests) - 1
+            zeros = report.lock_requests - len(self.waits)
+            report.p99_wait = self.waits[rank - zeros] if rank >= zeros else 0.0
+
+        for resource, (length, area, last, top) in self.queues.items():
+            area += length * (self.now - last)
+            report.queue_lengths[resource] = (area / self.now if self.now else 0.0, top)
+        return report
+
+
+def simulate(workload: Workload) -> Report:
+    return Simulator(workload).run()
+
+
+def main():
+    workload = Workload.from_file(sys.argv[1]) if len(sys.argv) > 1 else Workload()
+    print(json.dumps(asdict(workload)), file=sys.stderr)
+    print(simulate(workload).summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -65,4 +65,16 @@ def test_processor_iterable_output():
         
         stream_processor(test_input, test_output, test_error)
         
-        assert test_output.getvalue() == "part1\npart2\npart3\n"
\ No newline at end of file
+        assert test_output.getvalue() == "part1\npart2\npart3\n"
+
+
+def test_processor_structured_output():
+    """Test errors are written as records with a structured output."""
+    test_input = StringIO("Start 100\nStart 100\n")
+    test_output = StringIO()
+    test_error = StringIO()
+
+    stream_processor(test_input, test_output, test_error, output='tsv')
+
+    assert test_output.getvalue() == "transaction_started\t100\t\t\t0\t\nalready_started\t100\t\t\t1\t\n"
+    assert test_error.getvalue() == ""
@@ -0,0 +1,239 @@
+import copy
+import gc
+import random
+import time
+import pytest
+from lock_manager import LockManager, States
+from lock_manager.cow import CowDict, cow_fork, detach_step, writable
+
+
+def state(lm):
+    """Plain view of the lock state, to compare lock managers"""
+    return (
+        list(lm.transactions),
+        {t: dict(locks) for t, locks in lm.held_locks.items() if locks},
+        {r: list(fifo.items()) for r, fifo in lm.resource_fifo.items() if fifo},
+        {r: list(held.items()) for r, held in lm.held_resources.items() if held},
+        {t: dict(ranges) for t, ranges in lm.held_ranges.items() if ranges},
+        list(lm.range_fifo.items()),
+        sorted(lm.ranges.overlapping('', '￿')),
+        list(lm.index.held.items()),
+        list(lm.index.waits.items()),
+    )
+
+
+def random_request(rnd):
+    event = rnd.choice(['Start', 'End', 'SLock', 'ULock', 'XLock', 'Unlock'])
+    transaction = rnd.randrange(1, 6)
+    if event in ('Start', 'End'):
+        return event, transaction, None
+    resource = rnd.choice(['A', 'B', 'C', 'D', '[A,C)', '[B,D]', 'C*'])
+    return event, transaction, resource
+
+
+class TestFork:
+    """Test of the copy-on-write snapshot and fork"""
+
+    def test_cow_dict(self):
+        base = {'a': {'x': 1}, 'b': {'y': 2}}
+        mine, theirs = cow_fork(base, copy_values=True)
+
+        # reads are shared, only writable values are copied
+        assert mine['a'] is base['a']
+        writable(mine, 'a')['x'] = 10
+        writable(mine, 'd', {})['w'] = 4
+        del mine['d']
+        del mine['b']
+        mine['c'] = {}
+        assert dict(mine) == {'a': {'x': 10}, 'c': {}}
+        assert dict(theirs) == {'a': {'x': 1}, 'b': {'y': 2}}
+        assert base == {'a': {'x': 1}, 'b': {'y': 2}}
+        assert len(mine) == 2 and len(theirs) == 2
+
+        mine['b'] = {'z': 3}
+        assert set(mine) == {'a', 'b', 'c'}
+        assert len(mine) == 3
+
+    def test_cow_dict_flatten(self):
+        d = {}
+        forks = []
+        for i in range(100):
+            d, fork = cow_fork(d)
+            d[i] = i
+            d.pop(i - 10, None)
+            forks.append(fork)
+            assert len(fork) == min(i, 10)
+        assert d.depth <= 32
+        assert dict(d) == {i: i for i in range(90, 100)}
+        assert list(forks[50]) == list(range(40, 50))
+
+        # same order as a plain dict: overwritten keys keep their position,
+        # deleted and set again ones move to the end
+        plain = dict(d)
+        d, fork = cow_fork(d)
+        for key in (95, 92):
+            d[key] = plain[key] = 'x'
+        del d[97], plain[97]
+        d[97] = plain[97] = 'y'
+        d, fork = cow_fork(d)
+        d[91] = plain[91] = 'z'
+        assert list(d) == list(d.flatten()) == list(plain) == [90, 91, 92, 93, 94, 95, 96, 98, 99, 97]
+
+    def test_cow_dict_detach(self):
+        base = {i: {'v': i} for i in range(200)}
+        mine, theirs = cow_fork(base, copy_values=True)
+        writable(mine, 0)['v'] = 'x'
+        del mine[1]
+        mine[2] = {}
+        del mine[3]
+        mine[3] = {}
+        mine[300] = {}
+
+        while isinstance(mine, CowDict):
+            before = mine
+            mine = detach_step(mine)
+        assert type(mine) is dict
+        assert mine == dict(before)
+        assert list(mine) == list(before) == [0, 2] + list(range(4, 200)) + [3, 300]
+        assert all(mine[i] is not base[i] for i in range(4, 200))
+
+        # the fork is not affected, and still shares its values
+        mine[4]['v'] = 'y'
+        assert theirs[4] is base[4] and base[4] == {'v': 4}
+        assert dict(theirs) == base
+
+    def test_fork_reads_do_not_copy(self):
+        lm = LockManager()
+        lm.process_request_str("Start 100")
+        for i in range(1000):
+            lm.process_request_str(f"SLock 100 R{i}")
+
+        fork = lm.fork()
+        assert len(list(fork.held_resources.items())) == 1000
+        assert fork.holders("R1") == [(100, "R1", States.slock)]
+        assert len(fork.held_resources.local) == 0
+        fork.process_request_str("Unlock 100 R1")
+        assert len(fork.held_resources.local) == 1
+
+    def test_live_state_detached(self):
+        lm = LockManager()
+        lm.process_request_str("Start 100")
+        for i in range(1000):
+            lm.process_request_str(f"SLock 100 R{i}")
+        fork = lm.fork()
+        for _ in range(40):
+            lm.fork()
+
+        # the live lock manager goes back to plain dicts while serving requests
+        i = 0
+        while lm.detaching:
+            lm.process_request_str(f"XLock 100 Q{i}")
+            i += 1
+        assert i < 100
+        assert type(lm.held_resources) is dict and type(lm.index.held) is dict
+        assert len(lm.held_resources) == 1000 + i
+        assert isinstance(fork.held_resources, CowDict)
+        assert len(fork.held_resources) == 1000
+
+    def test_fork_keeps_order(self):
+        lm = LockManager()
+        for request in ["Start 1", "SLock 1 A", "SLock 1 B"]:
+            lm.process_request_str(request)
+        fork, expected = lm.fork(), copy.deepcopy(lm)
+
+        # the upgraded lock keeps its position, as in a plain dict
+        for m in (fork, expected):
+            m.process_request_str("XLock 1 A")
+        assert fork.process_request_str("Show") == expected.process_request_str("Show")
+        assert list(fork.dump()) == list(expected.dump())
+        assert state(fork) == state(expected)
+
+    def test_live_request_after_forks(self, monkeypatch):
+        lm = LockManager()
+        for t in range(1, 101):
+            lm.process_request_str(f"Start {t}")
+        for i in range(100000):
+            lm.process_request_str(f"SLock {i % 100 + 1} R{i}")
+
+        # forks taken back to back, while the live state is still detaching,
+        # cost each live request a few entries, not a merge of the layers
+        def flatten(d):
+            raise AssertionError("flatten on the request path")
+
+        monkeypatch.setattr(CowDict, 'flatten', flatten)
+        forks = []
+        worst = 0.0
+        gc.disable()
+        try:
+            for k in range(10):
+                forks.append(lm.fork())
+                start = time.perf_counter()
+                lm.process_request_str(f"XLock {k + 1} Q{k}")
+                worst = max(worst, time.perf_counter() - start)
+            monkeypatch.undo()
+            start = time.perf_counter()
+            lm.held_resources.flatten()
+            assert worst < time.perf_counter() - start
+        finally:
+            gc.enable()
+        assert lm.detaching and len(forks[0].held_resources) == 100000
+
+    def test_fork_isolation(self):
+        lm = LockManager()
+        lm.process_request_str("Start 100")
+        lm.process_request_str("Start 200")
+        lm.process_request_str("SLock 100 A")
+        lm.process_request_str("XLock 200 A")  # This will wait
+
+        fork = lm.fork()
+        # nothing is copied until it is modified
+        assert len(fork.held_resources.local) == 0
+
+        output = fork.process_request_str("End 100")
+        assert "X-Lock on A granted to 200" in output
+        assert ("A", States.xlock) in fork.held_locks[200].items()
+
+        # the live state is not disturbed
+        assert 100 in lm.transactions
+        assert lm.held_locks[100] == {"A": States.slock}
+        assert lm.waiting_for(200) == {"A": States.xlock}
+        assert fork.waiting_for(200) == {}
+
+        # and the fork is not affected by the live state
+        lm.process_request_str("Unlock 100 A")
+        assert 100 not in fork.held_resources["A"]
+        assert fork.held_resources["A"] == {200: States.xlock}
+
+    def test_snapshot_read_only(self):
+        lm = LockManager()
+        lm.process_request_str("Start 100")
+        lm.process_request_str("XLock 100 A")
+        snapshot = lm.snapshot()
+
+        with pytest.raises(ValueError, match='read only'):
+            snapshot.process_request_str("End 100")
+        assert snapshot.holders("A") == [(100, "A", States.xlock)]
+
+        fork = snapshot.fork()
+        assert "Transaction 100 ended" in fork.process_request_str("End 100")
+        assert snapshot.holders("A") == [(100, "A", States.xlock)]
+
+    def test_fork_matches_deepcopy(self):
+        rnd = random.Random(11)
+        self.step = 0
+        lms = [LockManager(clock=lambda: self.step)]
+        copies = [LockManager(clock=lambda: self.step)]
+
+        for self.step in range(3000):
+            step = self.step
+            if step % 100 == 99 and len(lms) < 6:
+                source = rnd.randrange(len(lms))
+                lms.append(lms[source].fork())
+                copies.append(copy.deepcopy(copies[source]))
+
+            i = rnd.randrange(len(lms))
+            request = random_request(rnd)
+            assert lms[i].process_request(*request) == copies[i].process_request(*request)
+
+        for lm, expected in zip(lms, copies):
+            assert state(lm) == state(expected)
@@ -0,0 +1,47 @@
+import random
+from lock_manager.fuzz import FuzzConfig, fuzz, make_schedule, request_lines, run_schedule
+from lock_manager.simple import LockManager, States
+
+
+class SharedOverExclusive(LockManager):
+    """SLock ignores the XLocks held by the other transactions"""
+
+    def blocking_holder(self, transaction, resource, lock_type):
+        if lock_type == States.slock:
+            return None
+        return super().blocking_holder(transaction, resource, lock_type)
+
+
+class TestFuzz:
+    """Test of the differential fuzzer"""
+
+    def test_engines_agree(self):
+        report = fuzz(FuzzConfig(ops=20000, seed=1, schedule_length=5000))
+
+        assert report.divergence is None
+        assert report.ops == 20000
+        assert report.schedules == 4
+
+    def test_engines_agree_skewed_and_forked(self):
+        report = fuzz(FuzzConfig(ops=10000, seed=2, skew=1.5, check_every=1, fork_every=5))
+
+        assert report.divergence is None
+
+    def test_schedule_is_deterministic(self):
+        config = FuzzConfig(skew=1.0)
+        schedule = make_schedule(random.Random(7), 1000, config)
+
+        assert schedule == make_schedule(random.Random(7), 1000, config)
+        assert all(r is None for e, t, r in schedule if e.value in ('Start', 'End'))
+        assert all(1 <= t <= config.transactions for e, t, r in schedule)
+
+    def test_divergence_shrunk(self):
+        report = fuzz(FuzzConfig(ops=10000, seed=3), engine=SharedOverExclusive)
+
+        assert report.divergence is not None
+        # Start, Start, XLock, SLock
+        assert len(report.reproducer) == 4
+        assert run_schedule(report.reproducer, engine=SharedOverExclusive) == report.divergence
+        assert run_schedule(report.reproducer) is None
+        lines = request_lines(report.reproducer)
+        assert lines[0].startswith('Start') and lines[-1].startswith('SLock')
@@ -0,0 +1,104 @@
+import json
+import pytest
+from lock_manager import LockManager, Command, Events, States
+from lock_manager import output
+from lock_manager.output import read_binary, read_tsv, to_binary, to_record
+
+
+class TestOutput:
+    """Test of the structured output modes"""
+
+    program = ['Start 100', 'Start 200', 'SLock 100 A', 'XLock 200 A', 'Start 100', 'End 100']
+
+    def run(self, output):
+        lm = LockManager(output=output)
+        return [lm.process_request_str(request) for request in self.program]
+
+    def test_jsonl(self):
+        outputs = self.run('jsonl')
+
+        assert json.loads(outputs[2]) == {
+            'cmd': 'granted', 'transaction': 100, 'resource': 'A', 'lock_type': 'slocked',
+            'extra': None, 'error': False}
+        assert json.loads(outputs[3])['extra'] == {'lock_type': 'slocked', 'transaction': 100}
+
+        # errors are records, not exceptions
+        assert json.loads(outputs[4])['error'] is True
+        assert json.loads(outputs[4])['cmd'] == 'already_started'
+
+        # one record per line
+        records = [json.loads(line) for line in outputs[5].split("\n")]
+        assert [r['cmd'] for r in records] == [
+            'transaction_ended', 'release_unlocked', 'resource_granted_to']
+
+    def test_tsv(self):
+        outputs = self.run('tsv')
+
+        assert outputs[2] == "granted\t100\tA\tslocked\t0\t"
+        assert outputs[3] == 'waiting\t200\tA\txlocked\t0\t{"lock_type":"slocked","transaction":100}'
+        assert outputs[4] == "already_started\t100\t\t\t1\t"
+
+        # extra is JSON, the raw input of an invalid request is not escaped again
+        output = LockManager(output='tsv').process_request_str("Who\tX\\")
+        assert output == 'cmd_not_valid\t\t\t\t1\t{"input":"Who\\tX\\\\"}'
+        assert len(output.split("\t")) == 6
+
+        # every record is parsed back, separators inside extra included
+        lm = LockManager(output='tsv')
+        expected = LockManager(output='jsonl')
+        for request in ("x=1,y=2 junk", "Start 1", "XLock 1 a\\tb", "XLock 1 [a,b)", "End 1"):
+            assert read_tsv(lm.process_request_str(request)) == [
+                json.loads(line) for line in expected.process_request_str(request).split("\n")]
+
+    def test_binary(self):
+        outputs = self.run('binary')
+        lm = LockManager()
+        expected = [lm.process_request_cmds(request) for request in self.program]
+
+        for out, cmds in zip(outputs, expected):
+            assert isinstance(out, bytes)
+            assert read_binary(out) == [to_record(cmd) for cmd in cmds]
+
+    def test_binary_transaction_range(self):
+        lm = LockManager(output='binary')
+        for request in ("Start 99999999999999999999", "Waits 99999999999999999999"):
+            record, = read_binary(lm.process_request_str(request))
+            assert record['cmd'] == 'cmd_not_valid'
+            assert record['extra'] == {'input': request}
+        assert lm.transactions == {}
+
+        record, = read_binary(lm.process_request_str(f"Start {2 ** 63 - 1}"))
+        assert record['transaction'] == 2 ** 63 - 1
+
+    def test_binary_record_size(self, monkeypatch):
+        lm = LockManager(output='binary')
+        lm.process_request_str("Start 1")
+        resource = "A" * 70000
+        record, = read_binary(lm.process_request_str(f"SLock 1 {resource}"))
+        assert record['cmd'] == 'granted' and record['resource'] == resource
+
+        # commands that don't fit are cmd_not_valid records, also from process_request
+        cmds = lm.process_request(Events.START, 2 ** 64)
+        record, = read_binary(to_binary(cmds))
+        assert record == {'cmd': 'cmd_not_valid', 'transaction': None, 'resource': None,
+                          'lock_type': None, 'extra': {'cmd': 'transaction_started'}, 'error': True}
+
+        monkeypatch.setattr(output, 'MAX_FIELD', 10)
+        records = read_binary(lm.process_request_str("XLock 1 ABCDEFGHIJK"))
+        assert [r['extra'] for r in records] == [{'cmd': 'granted'}]
+
+    def test_invalid_format(self):
+        lm = LockManager(output='jsonl')
+        record = json.loads(lm.process_request_str("Xlock A A"))
+        assert record['cmd'] == 'cmd_not_valid'
+        assert record['extra'] == {'input': 'Xlock A A'}
+
+        with pytest.raises(ValueError):
+            LockManager(output='xml')
+
+    def test_process_request_cmds(self):
+        lm = LockManager()
+        assert lm.process_request_cmds("Start 100") == [
+            Command('transaction_started', 100)]
+        assert lm.process_request_cmds("XLock 100 A") == [
+            Command('granted', 100, 'A', States.xlock)]
@@ -0,0 +1,77 @@
+import json
+import pytest
+from lock_manager import LockManager, States
+
+
+class TestQuery:
+    """Test of the introspection API over live lock state"""
+
+    @pytest.fixture(scope="function")
+    def lock_manager(self):
+        self.now = 0.0
+        lm = LockManager(clock=lambda: self.now)
+        for t in (100, 200, 300):
+            lm.process_request_str(f"Start {t}")
+        return lm
+
+    def test_holders(self, lock_manager):
+        lock_manager.process_request_str("SLock 100 A")
+        lock_manager.process_request_str("SLock 200 A")
+        lock_manager.process_request_str("XLock 300 [B,D)")
+
+        assert lock_manager.holders("A") == [
+            (100, "A", States.slock), (200, "A", States.slock)]
+        assert lock_manager.holders("C") == [(300, "[B,D)", States.xlock)]
+        assert lock_manager.holders("[A,C)") == [
+            (300, "[B,D)", States.xlock), (100, "A", States.slock), (200, "A", States.slock)]
+        assert lock_manager.holding(States.xlock) == [(300, "[B,D)")]
+
+        assert "A: S-lock held by 100\nA: S-lock held by 200" == lock_manager.process_request_str(
+            "Who A")
+        assert "E: not locked" == lock_manager.process_request_str("Who E")
+
+    def test_waits(self, lock_manager):
+        lock_manager.process_request_str("XLock 100 A")
+        lock_manager.process_request_str("XLock 200 A")  # This will wait
+        self.now = 5.0
+        lock_manager.process_request_str("SLock 300 A")  # This will wait
+        self.now = 7.5
+
+        assert lock_manager.waiting_for(200) == {"A": States.xlock}
+        assert [w[0] for w in lock_manager.waits_older_than(1.0)] == [200, 300]
+        assert [w[0] for w in lock_manager.waits_older_than(5.0)] == [200]
+
+        assert "200: waiting for X-lock on A (7.500s)" == lock_manager.process_request_str(
+            "Waits 200")
+        assert "100: not waiting" == lock_manager.process_request_str(
+            "Waits 100")
+
+        # granted and ended transactions are no longer waiting
+        lock_manager.process_request_str("End 300")
+        lock_manager.process_request_str("Unlock 100 A")
+        assert lock_manager.waiting_for(200) == {}
+        assert lock_manager.holding(States.xlock) == [(200, "A")]
+        assert "No transaction waiting" == lock_manager.process_request_str(
+            "Waits")
+
+    def test_dump(self, lock_manager):
+        lock_manager.process_request_str("XLock 100 A")
+        lock_manager.process_request_str("SLock 200 A")  # This will wait
+        lines = lock_manager.dump()
+
+        # the snapshot is not affected by later changes
+        lock_manager.process_request_str("End 100")
+        records = [json.loads(line) for line in lines]
+
+        assert {'type': 'held', 'transaction': 100, 'resource': 'A',
+                'lock_type': 'xlocked'} in records
+        assert {'type': 'waiting', 'transaction': 200, 'resource': 'A',
+                'lock_type': 'slocked', 'since': 0.0} in records
+        assert len([r for r in records if r['type'] == 'transaction']) == 3
+
+    def test_invalid_query(self, lock_manager):
+        with pytest.raises(IndexError):
+            lock_manager.process_request_str("Who")
+
+        with pytest.raises(IndexError):
+            lock_manager.process_request_str("Waits A")
@@ -0,0 +1,128 @@
+import random
+import pytest
+from lock_manager import Command, Events, LockManager, States
+from lock_manager.ranges import IntervalTree, parse_range
+
+
+class TestRanges:
+    """Test of the key range locks"""
+
+    @pytest.fixture(scope="function")
+    def lock_manager(self):
+        lm = LockManager()
+        for t in (100, 200, 300):
+            lm.process_request_str(f"Start {t}")
+        return lm
+
+    def test_parse_range(self):
+        assert parse_range("A") is None
+        assert parse_range("[A,M)") == ("A", "M")
+        assert parse_range("[A,M]") == ("A", "M\0")
+        assert parse_range("user*") == ("user", "uses")
+        assert parse_range("*") == ("", "")
+
+    def test_interval_tree_overlapping(self):
+        rnd = random.Random(7)
+        tree = IntervalTree()
+        intervals = {}
+        for i in range(500):
+            lo = rnd.randrange(1000)
+            hi = lo + rnd.randrange(1, 50)
+            tree.insert(lo, hi, i, i)
+            intervals[i] = (lo, hi)
+        for i in range(0, 500, 3):
+            tree.remove(*intervals.pop(i), i)
+        assert len(tree) == len(intervals)
+
+        for _ in range(200):
+            lo = rnd.randrange(1000)
+            hi = lo + rnd.randrange(1, 30)
+            expected = {i for i, (a, b) in intervals.items() if a < hi and lo < b}
+            assert {owner for _, _, owner, _ in tree.overlapping(lo, hi)} == expected
+
+    def test_range_lock_conflicts(self, lock_manager):
+        assert "SLock 100 [A,M): Lock granted" == lock_manager.process_request_str(
+            "SLock 100 [A,M)")
+
+        # shared ranges and keys inside them are compatible
+        assert "SLock 200 [K,Z): Lock granted" == lock_manager.process_request_str(
+            "SLock 200 [K,Z)")
+        assert "SLock 300 B: Lock granted" == lock_manager.process_request_str(
+            "SLock 300 B")
+
+        # exclusive requests wait for overlapping ranges
+        assert "XLock 300 [L,N]: Waiting for lock (S-lock held by: 100)" == lock_manager.process_request_str(
+            "XLock 300 [L,N]")
+        assert "XLock 300 C: Waiting for lock (S-lock held by: 100)" == lock_manager.process_request_str(
+            "XLock 300 C")
+
+        # keys outside any range are not affected
+        assert "XLock 300 M: Waiting for lock (S-lock held by: 200)" == lock_manager.process_request_str(
+            "XLock 300 M")
+        assert "XLock 300 Z: Lock granted" == lock_manager.process_request_str(
+            "XLock 300 Z")
+
+        with pytest.raises(ValueError, match=r'SLock 100 \[A,M\): Lock already held'):
+            lock_manager.process_request_str("SLock 100 [A,M)")
+
+    def test_range_lock_waits_for_keys(self, lock_manager):
+        lock_manager.process_request_str("XLock 100 user42")
+
+        assert "SLock 200 user*: Waiting for lock (X-lock held by: 100)" == lock_manager.process_request_str(
+            "SLock 200 user*")
+
+        output = lock_manager.process_request_str("Unlock 100 user42")
+        assert "S-Lock granted to 200" in output
+        assert lock_manager.held_ranges[200] == {"user*": States.slock}
+
+    def test_range_unlock(self, lock_manager):
+        lock_manager.process_request_str("XLock 100 [A,M)")
+        lock_manager.process_request_str("SLock 200 D")  # This will wait
+        lock_manager.process_request_str("SLock 300 [C,E)")  # This will wait
+
+        output = lock_manager.process_request_str("Unlock 100 [A,M)")
+        assert "Unlock 100 [A,M): Lock released" in output
+        assert "S-Lock granted to 200" in output
+        assert "S-Lock granted to 300" in output
+        assert ("D", States.slock) in lock_manager.held_locks[200].items()
+
+        with pytest.raises(ValueError, match='not locked'):
+            lock_manager.process_request_str("Unlock 100 [A,M)")
+
+    def test_range_end_transaction(self, lock_manager):
+        lock_manager.process_request_str("SLock 100 [A,M)")
+        lock_manager.process_request_str("XLock 200 [F,G)")  # This will wait
+
+        output = lock_manager.process_request_str("End 100")
+        assert "Release S-lock on [A,M)" in output
+        assert "X-Lock on [F,G) granted to 200" in output
+        assert 100 not in lock_manager.held_ranges
+
+        output = lock_manager.process_request_str("End 200")
+        assert "Release X-lock on [F,G)" in output
+        assert len(lock_manager.ranges) == 0
+
+    def test_end_releases_every_lock(self, lock_manager):
+        requests = ["Start 1", "Start 6", "XLock 6 ab*", "Start 2", "XLock 2 ab",
+                    "SLock 1 abc", "XLock 2 ab*", "ULock 2 abc", "End 6"]
+        for request in requests:
+            lock_manager.process_request_str(request)
+
+        # the waits of the ending transaction are not granted while it releases its locks
+        output = lock_manager.process_request_str("End 2")
+        assert "granted to 2" not in output
+        assert 2 not in lock_manager.held_resources["abc"]
+        assert lock_manager.held_resources["abc"] == {1: States.slock}
+        assert all(t != 2 for t, _ in lock_manager.index.held)
+        assert lock_manager.waiting_for(2) == {}
+
+    def test_invalid_range(self, lock_manager):
+        with pytest.raises(IndexError):
+            lock_manager.process_request_str("SLock 100 [M,A)")
+
+        with pytest.raises(IndexError):
+            lock_manager.process_request_str("SLock 100 [A,M")
+
+        # empty prefix
+        assert lock_manager.process_request(Events.SLOCK, 100, "*") == [
+            Command("cmd_not_valid", 100, "*")]
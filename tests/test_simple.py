@@ -355,3 +355,114 @@ class TestSimple:
         for i in range(len(program)):
             assert test_outputs[i] == lock_manager.process_request_str(
                 requests[i])
+
+    def test_ulock_compatibility(self, lock_manager):
+        # Setup
+        for t in (100, 200, 300, 400):
+            lock_manager.process_request_str(f"Start {t}")
+        lock_manager.process_request_str("SLock 100 A")
+
+        # U lock is compatible with S lock
+        assert "ULock 200 A: Lock granted" == lock_manager.process_request_str(
+            "ULock 200 A")
+        assert ("A", States.ulock) in [(k, v)
+                                       for k, v in lock_manager.held_locks[200].items()]
+
+        # S lock is compatible with U lock
+        assert "SLock 300 A: Lock granted" == lock_manager.process_request_str(
+            "SLock 300 A")
+
+        # U lock is not compatible with another U lock
+        assert "ULock 400 A: Waiting for lock (U-lock held by: 200)" == lock_manager.process_request_str(
+            "ULock 400 A")
+        output = lock_manager.process_request_str("ULock 300 A")
+        assert "Waiting for lock upgrade (U-lock held by: 200)" == output
+
+        with pytest.raises(ValueError, match='ULock 200 A: Lock already held'):
+            lock_manager.process_request_str("ULock 200 A")
+
+    def test_ulock_conversion(self, lock_manager):
+        # Setup
+        lock_manager.process_request_str("Start 100")
+        lock_manager.process_request_str("Start 200")
+
+        # S lock converts to U lock when no other U lock is held
+        lock_manager.process_request_str("SLock 100 A")
+        lock_manager.process_request_str("SLock 200 A")
+        assert "Upgraded to UL granted" == lock_manager.process_request_str(
+            "ULock 200 A")
+
+        # U lock converts to X lock once the other readers drain
+        output = lock_manager.process_request_str("XLock 200 A")
+        assert "Waiting for lock upgrade (S-lock held by: 100)" == output
+        output = lock_manager.process_request_str("Unlock 100 A")
+        assert "Upgraded to XL granted to 200" in output
+        assert ("A", States.xlock) in [(k, v)
+                                       for k, v in lock_manager.held_locks[200].items()]
+
+        # single U holder converts right away
+        lock_manager.process_request_str("ULock 100 B")
+        assert "Upgraded to XL granted" == lock_manager.process_request_str(
+            "XLock 100 B")
+
+    def test_ulock_conversion_not_starved(self, lock_manager):
+        # Setup
+        for t in (100, 200, 300):
+            lock_manager.process_request_str(f"Start {t}")
+        lock_manager.process_request_str("ULock 100 A")
+        lock_manager.process_request_str("SLock 200 A")
+        lock_manager.process_request_str("XLock 100 A")  # This will wait
+
+        # new readers queue behind the pending conversion
+        assert "SLock 300 A: Waiting for lock (U-lock held by: 100)" == lock_manager.process_request_str(
+            "SLock 300 A")
+        output = lock_manager.process_request_str("Unlock 200 A")
+        assert "Upgraded to XL granted to 100" in output
+        assert "S-Lock granted to 300" in lock_manager.process_request_str(
+            "Unlock 100 A")
+
+    def test_ulock_no_upgrade_deadlock(self, lock_manager):
+        # Setup, two read-modify-write transactions on the same resource
+        lock_manager.process_request_str("Start 100")
+        lock_manager.process_request_str("Start 200")
+        lock_manager.process_request_str("ULock 100 A")
+        assert "Waiting for lock" in lock_manager.process_request_str(
+            "ULock 200 A")
+
+        # the first one is never blocked by the second one
+        assert "Upgraded to XL granted" == lock_manager.process_request_str(
+            "XLock 100 A")
+        output = lock_manager.process_request_str("End 100")
+        assert "Release X-lock on A" in output
+        assert "U-Lock on A granted to 200" in output
+
+    def test_pending_upgrade_granted_first(self, lock_manager):
+        # Setup
+        for t in (100, 200, 300):
+            lock_manager.process_request_str(f"Start {t}")
+        lock_manager.process_request_str("SLock 100 A")
+        lock_manager.process_request_str("ULock 200 A")
+        lock_manager.process_request_str("XLock 300 A")  # This will wait
+        lock_manager.process_request_str("XLock 200 A")  # This will wait too
+
+        # the pending upgrade goes before the queued X lock
+        output = lock_manager.process_request_str("Unlock 100 A")
+        assert "Upgraded to XL granted to 200" in output
+        assert "granted to 300" not in output
+
+        output = lock_manager.process_request_str("Unlock 200 A")
+        assert "X-Lock granted to 300" in output
+
+    def test_no_grant_while_conflicting_holders(self, lock_manager):
+        # Setup
+        for t in (100, 200, 300):
+            lock_manager.process_request_str(f"Start {t}")
+        lock_manager.process_request_str("SLock 100 A")
+        lock_manager.process_request_str("SLock 200 A")
+        lock_manager.process_request_str("XLock 300 A")  # This will wait
+
+        # X lock is not granted until every reader is gone
+        assert "granted" not in lock_manager.process_request_str(
+            "Unlock 100 A")
+        assert "X-Lock granted to 300" in lock_manager.process_request_str(
+            "Unlock 200 A")
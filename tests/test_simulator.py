@@ -0,0 +1,48 @@
+import pytest
+from lock_manager.simulator import Simulator, Workload, simulate
+
+
+class TestSimulator:
+    """Test of the discrete-event simulator"""
+
+    def test_no_contention(self):
+        workload = Workload(clients=4, transactions=200, resources=10000,
+                            write_ratio=0.0, seed=1)
+        report = simulate(workload)
+
+        assert report.committed == 200
+        assert report.aborted == 0
+        assert report.avg_wait == 0.0
+        assert report.p99_wait == 0.0
+        assert report.throughput > 0
+        assert report.lock_requests == 200 * 4
+
+    def test_contention(self):
+        workload = Workload(clients=20, transactions=500, resources=5, skew=1.0,
+                            write_ratio=0.5, lock_timeout=0.02, seed=2)
+        simulator = Simulator(workload)
+        report = simulator.run()
+
+        assert report.committed + report.failed == 500
+        assert report.aborted > 0
+        assert 0 < report.avg_wait <= report.p99_wait
+        assert report.p99_wait == pytest.approx(workload.lock_timeout)
+        assert report.queue_lengths["R0"][1] > 0
+
+        # every lock is released at the end of the run
+        assert not simulator.lm.transactions
+        assert not any(simulator.lm.held_resources.values())
+
+    def test_reproducible(self):
+        workload = Workload(clients=8, transactions=300, resources=20, skew=0.8,
+                            upgrade_ratio=0.5, seed=3)
+        assert simulate(workload) == simulate(workload)
+
+    def test_update_locks(self):
+        workload = dict(clients=10, transactions=300, resources=3, write_ratio=0.0,
+                        upgrade_ratio=1.0, locks_per_transaction=1, lock_timeout=0.05, seed=4)
+        upgrades = simulate(Workload(update_lock='SLock', **workload))
+        updates = simulate(Workload(update_lock='ULock', **workload))
+
+        assert updates.aborted < upgrades.aborted
+        assert updates.throughput > upgrades.throughput